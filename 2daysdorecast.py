@@ -1,12 +1,16 @@
 import os
-import requests
-import urllib3
-from PIL import Image, ImageDraw
-import io
-import numpy as np
-
-# 關閉不安全的 SSL 憑證警告
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import sys
+from concurrent.futures import Future
+from functools import partial
+from seanforecast.compose import (
+    compile_panel, composite_panel, make_white_transparent, DEFAULT_RESAMPLE, WHITE_THRESHOLD
+)
+from seanforecast.cache import InitTimeResolver
+from seanforecast.fetch import create_session, get_init_time, download_image, fetch_image_bytes
+from seanforecast.output import save_output
+from seanforecast.basemap import load_base_map
+from seanforecast.composite_pool import COMPOSITE_PROCESSES, CompositePool, SharedCanvas
+from seanforecast.manifest import manifest, config_digest, file_digest, encoding_inputs
 
 # ==========================================
 # ⚙️ 設定區：檔案路徑與目錄
@@ -45,6 +49,7 @@ def get_standard_fxx(init_time_str, day_offset):
     """ECMWF, GFS, GSM 的通用 fxx 判定邏輯 (01, 02)"""
     return f"{day_offset:02d}"
 
+# 各模式可設定 'resample' 覆寫縮放方式 (預設 LANCZOS，可選項目見 seanforecast/compose.py 的 RESAMPLE_POLICIES)
 MODELS = {
     'cwa_qpf': {
         'csv_url': 'https://watch.ncdr.nat.gov.tw/php/list_realtime_date_csv.php?v=CWB_QPF_OFFICIAL',
@@ -56,6 +61,7 @@ MODELS = {
             {'w': 415.4, 'h': 293.9, 'x': 642.6, 'y': 1881}
         ],
         'keep_box': None,
+        'white_threshold': 200, # 去白底閥值 (R、G、B 皆大於此值視為白色；省略時為 WHITE_THRESHOLD)
         'get_fxx': get_cwa_qpf_fxx
     },
     'ecmwf_wrf': {
@@ -68,6 +74,7 @@ MODELS = {
             {'w': 98.1, 'h': 834.2, 'x': 2046.9, 'y': 1371.2}
         ],
         'keep_box': None,
+        'white_threshold': 200,
         'get_fxx': get_standard_fxx
     },
     'gfs_fnv3': {
@@ -81,6 +88,7 @@ MODELS = {
             {'w': 236.1, 'h': 196.7, 'x': 2285, 'y': 1997.7},
             {'w': 143.5, 'h': 1057.5, 'x': 3165.4, 'y': 1136.9}
         ],
+        'white_threshold': 200,
         'get_fxx': get_standard_fxx
     },
     'gsm_ai': {
@@ -93,6 +101,7 @@ MODELS = {
             {'w': 205.1, 'h': 1036.5, 'x': 4287.8, 'y': 1169}
         ],
         'keep_box': None,
+        'white_threshold': 200,
         'get_fxx': get_standard_fxx
     }
 }
@@ -101,69 +110,30 @@ MODELS = {
 # 🧠 核心處理邏輯
 # ==========================================
 
-def get_init_time(csv_url):
-    """取得資料最新初始時間 (YYYYMMDDHHMM)"""
-    try:
-        r = requests.get(csv_url, verify=False, timeout=10)
-        r.raise_for_status()
-        content = r.text.strip()
-        # 內容格式通常為 "KEY_date,202602211200"
-        if ',' in content:
-            return content.split(',')[1].strip()
-        return None
-    except Exception as e:
-        print(f"取得初始時間失敗 ({csv_url}): {e}")
-        return None
-
-def download_image(url):
-    """下載影像並回傳 PIL Image 物件 (轉為 RGBA)"""
-    try:
-        r = requests.get(url, verify=False, timeout=15)
-        r.raise_for_status()
-        img = Image.open(io.BytesIO(r.content)).convert("RGBA")
-        return img
-    except Exception as e:
-        print(f" 下載失敗: {url}\n ({e})")
-        return None
-
-# ==========================================
-# 新增：去白底函式
-# ==========================================
-def make_white_transparent(img, threshold=200):
-    """將白色背景轉為透明"""
-    img = img.convert("RGBA")
-    data = np.array(img)
-    
-    r, g, b, a = data[:,:,0], data[:,:,1], data[:,:,2], data[:,:,3]
-    # 判斷白色 (R,G,B 都大於閥值)
-    white_mask = (r > threshold) & (g > threshold) & (b > threshold)
-    
-    # 將符合條件的像素 Alpha 設為 0 (透明)
-    data[..., 3][white_mask] = 0
-    
-    return Image.fromarray(data)
-
 # ==========================================
 # 替換：處理與合成邏輯 (加入去白底步驟)
 # ==========================================
 # ==========================================
 # 替換：處理與合成邏輯 (修正 keep_box 破壞去背的問題)
 # ==========================================
-def process_and_composite(canvas, model_name, model_config, day_offset):
-    """處理單一預報模型並合成至畫布"""
+def process_and_composite(canvas, model_name, model_config, day_offset, resolve_init_time=get_init_time, session=None, pool=None):
+    """
+    處理單一預報模型並合成至畫布，回傳是否成功 (依規則不產出也視為成功)
+    多行程模式 (pool 為 CompositePool、canvas 為 SharedCanvas) 下載成功時回傳 Future (結果為是否成功)
+    """
     print(f"\n[{model_name}] 準備處理 Day {day_offset}...")
     
-    # 1. 取得初始時間
-    init_time_str = get_init_time(model_config['csv_url'])
+    # 1. 取得初始時間 (由 resolve_init_time 依 csv_url 去重與快取)
+    init_time_str = resolve_init_time(model_config['csv_url'])
     if not init_time_str:
         print(f" 錯誤: 無法取得 {model_name} 的初始時間")
-        return
+        return False
 
     # 2. 判斷 fXX
     fxx = model_config['get_fxx'](init_time_str, day_offset)
     if not fxx:
         print(f" 提示: 依據規則，{model_name} 在此日期 (Day {day_offset}) 不產出圖片。跳過。")
-        return
+        return True
 
     # 3. 組合 URL
     yyyy_mm = init_time_str[:6]
@@ -177,86 +147,114 @@ def process_and_composite(canvas, model_name, model_config, day_offset):
     )
     
     print(f" 正在下載: {url}")
-    img = download_image(url)
-    if not img: return
+    if pool is not None:
+        # 解碼、去白底與合成交給行程池，本行程繼續下載下一個模型
+        content = fetch_image_bytes(url, session)
+        if content is None: return False
+        return pool.submit(canvas, content, model_config, model_config.get('white_threshold', WHITE_THRESHOLD))
 
-    # 將下載的圖片白色背景轉為透明
-    img = make_white_transparent(img)
-
-    # 4. 建立透明圖層以進行精準裁切與合成
-    layer = Image.new("RGBA", canvas.size, (0, 0, 0, 0))
-    
-    # 縮放下載的影像
-    cfg_L = model_config['layout']
-    target_size = (int(round(cfg_L['w'])), int(round(cfg_L['h'])))
-    img_resized = img.resize(target_size, Image.Resampling.LANCZOS)
-    
-    # 貼上透明圖層的指定座標 (使用自身作為遮罩保留透明度)
-    paste_pos = (int(round(cfg_L['x'])), int(round(cfg_L['y'])))
-    layer.paste(img_resized, paste_pos, img_resized)
+    img = download_image(url, session)
+    if not img: return False
 
-    # 5. 製作遮罩 (Alpha Mask)
-    # 取出目前的 Alpha 通道，保留剛剛去白底的效果
-    alpha_mask = layer.split()[3]
-    draw = ImageDraw.Draw(alpha_mask)
-
-    # 若有「裁減尺寸(要的區域)」
-    # 修正：不覆蓋內部 Alpha，而是將「要的區域以外」的四周填滿透明(0)
-    keep = model_config.get('keep_box')
-    if keep:
-        kx, ky = int(round(keep['x'])), int(round(keep['y']))
-        kw, kh = int(round(keep['w'])), int(round(keep['h']))
-        
-        # 畫四個透明矩形(fill=0)，把保留區塊外的地方遮掉
-        draw.rectangle([0, 0, canvas.width, ky], fill=0)                     # 上方區域
-        draw.rectangle([0, ky + kh, canvas.width, canvas.height], fill=0)    # 下方區域
-        draw.rectangle([0, ky, kx, ky + kh], fill=0)                         # 左側區域
-        draw.rectangle([kx + kw, ky, canvas.width, ky + kh], fill=0)         # 右側區域
-
-    # 執行「不要的區域」裁切 (塗黑=透明)
-    for mask in model_config['masks']:
-        mx, my = int(round(mask['x'])), int(round(mask['y']))
-        mw, mh = int(round(mask['w'])), int(round(mask['h']))
-        draw.rectangle([mx, my, mx + mw, my + mh], fill=0)
+    # 將下載的圖片白色背景轉為透明
+    img = make_white_transparent(img, model_config.get('white_threshold', WHITE_THRESHOLD))
 
-    # 6. 套用遮罩並合成至最終畫布
-    layer.putalpha(alpha_mask)
-    canvas.alpha_composite(layer)
+    # 4. 縮放、裁切 (keep_box / masks) 並合成至畫布 (只處理面板範圍)
+    panel = compile_panel(
+        model_config['layout'], model_config['masks'],
+        keep_box=model_config.get('keep_box')
+    )
+    composite_panel(canvas, img, panel, model_config.get('resample'))
     print(f" ✓ {model_name} 去白底並合成成功！")
+    return True
+
+def card_inputs(base_map_path, day_offset, resolve_init_time):
+    """預報圖的輸入 (與 manifest 紀錄相同時可略過重新產生)；初始時間由 resolve_init_time 快取，不會重複查詢"""
+    return {
+        "init_time": {cfg['csv_url']: resolve_init_time(cfg['csv_url']) for cfg in MODELS.values()},
+        "day_offset": day_offset,
+        "layout": config_digest(MODELS),
+        "resample": DEFAULT_RESAMPLE,
+        "base_map": file_digest(base_map_path),
+        "encoding": encoding_inputs(),
+    }
 
 # ==========================================
 # 🚀 主程式執行
 # ==========================================
-def create_forecast_card(base_map_path, output_filename, day_offset):
+def create_forecast_card(base_map_path, output_filename, day_offset, resolve_init_time=get_init_time, session=None, force=False, pool=None):
     print(f"\n{'='*50}")
     print(f"開始產生 Day {day_offset} 預報圖...")
     print(f"{'='*50}")
+
+    # 各模式初始時間、版面與底圖皆未變動時略過 (不下載、不合成)
+    out_path = os.path.join(OUTPUT_DIR, output_filename)
+    inputs = card_inputs(base_map_path, day_offset, resolve_init_time)
+    if manifest.is_current(out_path, inputs, force):
+        print("輸入皆未變動，略過產生 (可用 --force 強制重新產生)")
+        return
     
     if not os.path.exists(base_map_path):
         print(f"嚴重錯誤: 找不到底圖 {base_map_path}")
         return
 
-    # 載入底圖
-    canvas = Image.open(base_map_path).convert("RGBA")
-
-    # 依序處理 4 個模型
-    for model_name, config in MODELS.items():
-        process_and_composite(canvas, model_name, config, day_offset)
+    # 載入底圖 (解碼後的快取見 seanforecast/basemap.py)；多行程模式時放在共享記憶體中
+    if pool is None:
+        canvas = load_base_map(base_map_path)
+        # 依序處理 4 個模型
+        ok = True
+        for model_name, config in MODELS.items():
+            ok &= process_and_composite(canvas, model_name, config, day_offset, resolve_init_time, session)
 
-    # 儲存
-    out_path = os.path.join(OUTPUT_DIR, output_filename)
-    canvas.save(out_path, format="PNG")
+        # 儲存 (有模型失敗時不記錄，下次執行會再重試)
+        save_output(canvas, out_path)
+    else:
+        shared = SharedCanvas(base_map_path)
+        try:
+            results = [
+                process_and_composite(shared, model_name, config, day_offset, resolve_init_time, session, pool)
+                for model_name, config in MODELS.items()
+            ]
+            ok = all([r.result() if isinstance(r, Future) else r for r in results])
+            canvas = shared.image()
+            save_output(canvas, out_path)
+            # 釋放對共享記憶體的參照後才能關閉
+            del canvas
+        finally:
+            shared.close()
+    if ok:
+        manifest.record(out_path, inputs)
     print(f"\n🎉 圖片儲存成功: {out_path}\n")
 
-def main():
-    # Day 1: 明天
-    create_forecast_card(BASE_MAP_TOMORROW, OUTPUT_NAME_TOMORROW, day_offset=1)
-    
-    # Day 2: 後天
-    create_forecast_card(BASE_MAP_DAYAFTER, OUTPUT_NAME_DAYAFTER, day_offset=2)
+def main(session=None, resolve_init_time=None, force=False):
+    """
+    session / resolve_init_time 可由多產品執行器 (python -m seanforecast run) 傳入共用；
+    未傳入時自行建立。force=True 時忽略 manifest，一律重新產生
+    """
+    own_session = session is None
+    if own_session:
+        session = create_session()
+
+    # 兩張預報圖共用同一份初始時間查詢結果
+    if resolve_init_time is None:
+        resolve_init_time = InitTimeResolver(partial(get_init_time, session=session))
+
+    # COMPOSITE_PROCESSES > 0 時各模型由行程池合成 (見 seanforecast/composite_pool.py)，兩張預報圖共用
+    pool = CompositePool(COMPOSITE_PROCESSES) if COMPOSITE_PROCESSES > 0 else None
+    try:
+        # Day 1: 明天
+        create_forecast_card(BASE_MAP_TOMORROW, OUTPUT_NAME_TOMORROW, day_offset=1, resolve_init_time=resolve_init_time, session=session, force=force, pool=pool)
+
+        # Day 2: 後天
+        create_forecast_card(BASE_MAP_DAYAFTER, OUTPUT_NAME_DAYAFTER, day_offset=2, resolve_init_time=resolve_init_time, session=session, force=force, pool=pool)
+    finally:
+        if pool is not None:
+            pool.close()
+        if own_session:
+            session.close()
     
     print("所有作業處理完畢！")
 
 if __name__ == "__main__":
 
-    main()
+    main(force="--force" in sys.argv[1:])
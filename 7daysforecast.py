@@ -1,12 +1,19 @@
 import os
-import requests
-import urllib3
-import io
-import numpy as np
-from PIL import Image, ImageDraw
-
-# 關閉不安全的 SSL 憑證警告
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import sys
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from seanforecast.compose import (
+    compile_panel, composite_panel, make_white_transparent, DEFAULT_RESAMPLE, WHITE_THRESHOLD
+)
+from seanforecast.cache import InitTimeResolver
+from seanforecast.fetch import create_session, get_init_time, fetch_image_bytes, decode_image
+from seanforecast.output import save_output
+from seanforecast.basemap import load_base_map
+from seanforecast.composite_pool import COMPOSITE_PROCESSES, CompositePool, SharedCanvas
+from seanforecast.manifest import manifest, config_digest, file_digest, encoding_inputs
 
 # ==========================================
 # ⚙️ 設定區：檔案路徑與目錄
@@ -22,6 +29,12 @@ BASE_MAP_2 = "./7daysforecast_background_2.png" # 供第 5~7 天使用
 OUTPUT_NAME_1 = "ECMWF_Forecast_Days_1_to_4.png"
 OUTPUT_NAME_2 = "ECMWF_Forecast_Days_5_to_7.png"
 
+# 底圖編號 → (底圖, 輸出檔名)
+CARDS = {
+    1: (BASE_MAP_1, OUTPUT_NAME_1),
+    2: (BASE_MAP_2, OUTPUT_NAME_2),
+}
+
 # 建立輸出資料夾
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -29,10 +42,20 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 CSV_URL = "https://watch.ncdr.nat.gov.tw/php/list_realtime_date_csv.php?v=CHART_ECMWF_WRFDS"
 IMG_TEMPLATE = "https://watch.ncdr.nat.gov.tw/00_Wxmap/2F7_ECMWF_0.25deg/{YYYYMM}/{YYYYMMDDHH}/ecwrf_rain_{YYYYMMDDHH}_f{XX}.png"
 
+# 同時下載的連線數 (設為 1 即為逐一下載)，可用環境變數 FETCH_WORKERS 覆寫
+# 實際並行數另受每主機上限 FETCH_HOST_LIMIT (seanforecast/resilient.py，預設 16，與 2 天預報共用) 限制
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "7"))
+
+# 已解碼、等待 (或正在) 合成的圖片數上限 (下載不受限制，超過時先暫停解碼)，可用環境變數 PIPELINE_DEPTH 覆寫
+PIPELINE_DEPTH = int(os.environ.get("PIPELINE_DEPTH", "2"))
+
 # ==========================================
 # 🛠 版面配置與遮罩設定 (自動四捨五入)
 # ==========================================
 # 定義 7 天各自的座標與要去除的區域 (遮罩)
+# 可在各天設定 'white_threshold' 覆寫去白底閥值 (預設 WHITE_THRESHOLD)、'resample' 覆寫縮放方式
+# (預設 LANCZOS，可選項目見 seanforecast/compose.py 的 RESAMPLE_POLICIES)
+
 LAYOUT_CONFIGS = {
     1: { # 第 1 天
         'base': 1,
@@ -103,98 +126,121 @@ LAYOUT_CONFIGS = {
 # 🧠 核心處理邏輯
 # ==========================================
 
-def get_init_time(csv_url):
-    """取得資料最新初始時間 (YYYYMMDDHHMM)"""
-    try:
-        r = requests.get(csv_url, verify=False, timeout=10)
-        r.raise_for_status()
-        content = r.text.strip()
-        if ',' in content:
-            return content.split(',')[1].strip()
-        return None
-    except Exception as e:
-        print(f"取得初始時間失敗: {e}")
-        return None
+def build_url(day_idx, init_time_str):
+    """組合第 day_idx 天 (f01 ~ f07) 的圖片 URL"""
+    return IMG_TEMPLATE.format(
+        YYYYMM=init_time_str[:6],
+        YYYYMMDDHH=init_time_str[:10],
+        XX=f"{day_idx:02d}"
+    )
 
-def download_image(url):
-    """下載影像並回傳 PIL Image 物件"""
-    try:
-        r = requests.get(url, verify=False, timeout=15)
-        r.raise_for_status()
-        return Image.open(io.BytesIO(r.content)).convert("RGBA")
-    except Exception as e:
-        print(f" 下載失敗: {url}\n ({e})")
-        return None
+def stream_days(init_time_str, days, session, max_workers=FETCH_WORKERS, depth=PIPELINE_DEPTH, decode=True):
+    """
+    同時下載各天的圖片，依完成順序逐一產出 (day_idx, Image 或 None)
+    下載完成的內容先取得名額才解碼：已解碼但尚未合成完的圖片最多 depth 張，
+    合成端取下一張時才歸還上一張的名額 (記憶體上限與 depth 成正比，而非天數)
+    decode=False 時產出原始影像內容 (交給合成行程池解碼)
+    """
+    urls = {day_idx: build_url(day_idx, init_time_str) for day_idx in days}
+    for day_idx, url in urls.items():
+        print(f"[Day {day_idx}] 下載: {url}")
+
+    ready = queue.Queue()
+    slots = threading.Semaphore(max(depth, 1))
+    cancelled = threading.Event()
+
+    def produce(day_idx, url):
+        img = None
+        try:
+            content = fetch_image_bytes(url, session)
+            # 等待名額 (合成端中止時放棄)
+            while not slots.acquire(timeout=0.2):
+                if cancelled.is_set():
+                    return
+            if content is not None:
+                img = decode_image(content, url) if decode else content
+        finally:
+            ready.put((day_idx, img))
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+        # 複製 context，讓下載的追蹤紀錄 (span) 歸屬於本產品
+        for day_idx, url in urls.items():
+            pool.submit(contextvars.copy_context().run, produce, day_idx, url)
+        try:
+            for _ in urls:
+                yield ready.get()
+                slots.release()
+        finally:
+            cancelled.set()
 
-def make_white_transparent(img, threshold=220):
-    """將白色背景轉為透明"""
-    img = img.convert("RGBA")
-    data = np.array(img)
-    
-    r, g, b, a = data[:,:,0], data[:,:,1], data[:,:,2], data[:,:,3]
-    # 判斷接近白色的像素
-    white_mask = (r > threshold) & (g > threshold) & (b > threshold)
-    
-    # 將符合條件的像素 Alpha 設為 0 (透明)
-    data[..., 3][white_mask] = 0
-    return Image.fromarray(data)
-
-def process_day(day_idx, init_time_str, canvases):
-    """處理單日資料並貼到對應底圖上"""
+def card_inputs(base_idx, init_time_str):
+    """第 base_idx 張輸出圖的輸入 (與 manifest 紀錄相同時可略過重新產生)"""
+    configs = {d: c for d, c in LAYOUT_CONFIGS.items() if c['base'] == base_idx}
+    return {
+        "init_time": {CSV_URL: init_time_str},
+        "layout": config_digest([IMG_TEMPLATE, WHITE_THRESHOLD, configs]),
+        "resample": DEFAULT_RESAMPLE,
+        "base_map": file_digest(CARDS[base_idx][0]),
+        "encoding": encoding_inputs(),
+    }
+
+def process_day(day_idx, img, canvases, pool=None):
+    """
+    處理單日資料並貼到對應底圖上
+    多行程模式 (pool 為 CompositePool) 時 img 為原始影像內容，交給行程池合成到共享畫布並回傳 Future
+    """
     config = LAYOUT_CONFIGS[day_idx]
     base_idx = config['base']
     canvas = canvases[base_idx]
-    
-    # 1. 組合 URL (f01 ~ f07)
-    yyyy_mm = init_time_str[:6]
-    yyyy_mm_dd_hh = init_time_str[:10]
-    fxx = f"{day_idx:02d}"
-    
-    url = IMG_TEMPLATE.format(
-        YYYYMM=yyyy_mm, 
-        YYYYMMDDHH=yyyy_mm_dd_hh, 
-        XX=fxx
-    )
-    
-    print(f"[Day {day_idx}] 下載與處理: {url}")
-    img = download_image(url)
-    if not img: return
+
+    # 1. 圖片已由 stream_days 下載
+    if not img:
+        print(f" ✗ Day {day_idx} 無圖片，略過")
+        return None
+
+    if pool is not None:
+        return pool.submit(canvas, img, config, config.get('white_threshold', WHITE_THRESHOLD))
 
     # 2. 去除白底
-    img = make_white_transparent(img)
-
-    # 3. 建立與底圖大小相同的透明中繼圖層
-    layer = Image.new("RGBA", canvas.size, (0, 0, 0, 0))
-    
-    # 4. 縮放與貼上
-    cfg_L = config['layout']
-    target_size = (int(round(cfg_L['w'])), int(round(cfg_L['h'])))
-    img_resized = img.resize(target_size, Image.Resampling.LANCZOS)
-    
-    paste_pos = (int(round(cfg_L['x'])), int(round(cfg_L['y'])))
-    layer.paste(img_resized, paste_pos, img_resized)
-
-    # 5. 利用 Alpha 遮罩將「不要的區域」透明化
-    alpha_mask = layer.split()[3]
-    draw = ImageDraw.Draw(alpha_mask)
-
-    for mask in config['masks']:
-        mx, my = int(round(mask['x'])), int(round(mask['y']))
-        mw, mh = int(round(mask['w'])), int(round(mask['h']))
-        # 畫上全透明方塊 (fill=0)
-        draw.rectangle([mx, my, mx + mw, my + mh], fill=0)
-
-    # 套用遮罩
-    layer.putalpha(alpha_mask)
-    
-    # 6. 合成至最終畫布
-    canvas.alpha_composite(layer)
+    img = make_white_transparent(img, config.get('white_threshold', WHITE_THRESHOLD))
+
+    # 3. 縮放、遮罩並合成至最終畫布 (版面相同的天數共用同一份編譯好的遮罩)
+    panel = compile_panel(config['layout'], config['masks'])
+    composite_panel(canvas, img, panel, config.get('resample'))
     print(f" ✓ Day {day_idx} 已成功合成至底圖 {base_idx}")
 
+def save_card(base_idx, canvas, pending, failed, out_path, inputs):
+    """底圖的所有天數都已合成 (多行程模式時先等待 pending 的 Future)，存檔並記錄"""
+    if isinstance(canvas, SharedCanvas):
+        for day_idx, future in pending:
+            if future.result():
+                print(f" ✓ Day {day_idx} 已成功合成至底圖 {base_idx}")
+            else:
+                failed.add(base_idx)
+        img = canvas.image()
+        try:
+            save_output(img, out_path)
+        finally:
+            # 釋放對共享記憶體的參照後才能關閉
+            del img
+            canvas.close()
+    else:
+        # 存檔輸出 (編碼設定見 seanforecast/output.py，可用 OUTPUT_PROFILE 切換)
+        save_output(canvas, out_path)
+    print(f"輸出圖 {base_idx}: {out_path}")
+
+    # 有圖片下載失敗時不記錄，下次執行會再重試
+    if base_idx not in failed:
+        manifest.record(out_path, inputs)
+
 # ==========================================
 # 🚀 主程式執行
 # ==========================================
-def main():
+def main(session=None, resolve_init_time=None, force=False):
+    """
+    session / resolve_init_time 可由多產品執行器 (python -m seanforecast run) 傳入共用；
+    未傳入時自行建立。force=True 時忽略 manifest，一律重新產生
+    """
     print("="*50)
     print(" ECMWF WRF 7天預報自動下載與合成程式")
     print("="*50)
@@ -204,34 +250,60 @@ def main():
         print(f"嚴重錯誤: 找不到底圖檔案，請確認路徑設定正確。")
         return
 
-    # 載入底圖
-    canvases = {
-        1: Image.open(BASE_MAP_1).convert("RGBA"),
-        2: Image.open(BASE_MAP_2).convert("RGBA")
-    }
+    own_session = session is None
+    if own_session:
+        session = create_session(FETCH_WORKERS)
+    if resolve_init_time is None:
+        resolve_init_time = InitTimeResolver(partial(get_init_time, session=session))
 
-    # 取得最新初始時間
-    print("\n獲取最新初始時間...")
-    init_time_str = get_init_time(CSV_URL)
-    if not init_time_str:
-        print("終止作業：無法取得初始時間")
-        return
-    print(f"初始時間為: {init_time_str}")
-
-    # 依序處理 1~7 天
-    for day_idx in range(1, 8):
-        process_day(day_idx, init_time_str, canvases)
-
-    # 存檔輸出
-    out_path_1 = os.path.join(OUTPUT_DIR, OUTPUT_NAME_1)
-    out_path_2 = os.path.join(OUTPUT_DIR, OUTPUT_NAME_2)
-    
-    canvases[1].save(out_path_1, format="PNG")
-    canvases[2].save(out_path_2, format="PNG")
-    
+    # 提前結束 (無初始時間、輸入未變動) 時 finally 也會用到
+    pool, canvases = None, {}
+    try:
+        # 取得最新初始時間
+        print("\n獲取最新初始時間...")
+        init_time_str = resolve_init_time(CSV_URL)
+        if not init_time_str:
+            print("終止作業：無法取得初始時間")
+            return
+        print(f"初始時間為: {init_time_str}")
+
+        # 只重新產生輸入 (初始時間、版面、底圖) 有變動的輸出圖
+        inputs = {b: card_inputs(b, init_time_str) for b in CARDS}
+        out_paths = {b: os.path.join(OUTPUT_DIR, name) for b, (_, name) in CARDS.items()}
+        stale = [b for b in CARDS if not manifest.is_current(out_paths[b], inputs[b], force)]
+        if not stale:
+            print("輸入皆未變動，略過產生 (可用 --force 強制重新產生)")
+            return
+
+        # 下載與合成同時進行：每張圖片下載完成即合成，某張底圖的天數全部完成時立即存檔並釋放
+        days = [d for d in sorted(LAYOUT_CONFIGS) if LAYOUT_CONFIGS[d]['base'] in stale]
+        remaining = {b: sum(LAYOUT_CONFIGS[d]['base'] == b for d in days) for b in stale}
+        failed, pending = set(), {}
+        # COMPOSITE_PROCESSES > 0 時各面板由行程池合成到共享記憶體中的畫布 (見 seanforecast/composite_pool.py)
+        pool = CompositePool(COMPOSITE_PROCESSES) if COMPOSITE_PROCESSES > 0 else None
+        for day_idx, img in stream_days(init_time_str, days, session, decode=pool is None):
+            b = LAYOUT_CONFIGS[day_idx]['base']
+            if b not in canvases:
+                # 載入底圖 (解碼後的快取見 seanforecast/basemap.py)
+                canvases[b] = SharedCanvas(CARDS[b][0]) if pool else load_base_map(CARDS[b][0])
+            if not img:
+                failed.add(b)
+            future = process_day(day_idx, img, canvases, pool)
+            if future is not None:
+                pending.setdefault(b, []).append((day_idx, future))
+            img = None
+
+            remaining[b] -= 1
+            if not remaining[b]:
+                save_card(b, canvases.pop(b), pending.pop(b, []), failed, out_paths[b], inputs[b])
+    finally:
+        if pool is not None:
+            pool.close()
+            for canvas in canvases.values():
+                canvas.close()
+        if own_session:
+            session.close()
     print("\n🎉 作業完成！")
-    print(f"輸出圖 1 (Day 1-4): {out_path_1}")
-    print(f"輸出圖 2 (Day 5-7): {out_path_2}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(force="--force" in sys.argv[1:])
\ No newline at end of file
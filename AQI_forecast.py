@@ -3,15 +3,24 @@ AQI 空氣品質預報面量圖產生器 + 自動疊圖
 自動下載 CSV 資料，結合縣市 SHP 底圖，產出 3 天預報並合成至固定底圖
 """
 
+import io
 import requests
-import pandas as pd
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import numpy as np
 from datetime import datetime, timedelta
 import os
+import sys
 import urllib3
-from PIL import Image  # 新增：用於影像合成
+from urllib.parse import quote
+from seanforecast.store import load_frame, save_frame
+from seanforecast.output import save_output
+from seanforecast.basemap import load_base_map
+from seanforecast.stages import stage, annotate
+from seanforecast.manifest import manifest, config_digest, file_digest, encoding_inputs
+from seanforecast.county_map import (
+    MapStyle, draw_choropleth, palette_rgba, load_county_geometry, load_county_index_map, source_hash
+)
+from seanforecast.render_pool import render_choropleths
+
+# pandas / geopandas / matplotlib 載入較慢，只在用到的步驟才 import
 
 # 關閉不安全的 SSL 憑證警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -38,6 +47,20 @@ CSV_URL = (
     "&limit=1000&sort=publishtime%20desc&format=CSV"
 )
 
+# 只讀取需要的欄位 (全部以字串讀入，不做型別推斷)
+FORECAST_COLUMNS = ["publishtime", "area", "forecastdate", "aqi"]
+
+# 預報資料本地儲存
+# AQI_INGEST=incremental (預設) → 只下載比儲存檔更新的資料並合併
+# AQI_INGEST=full              → 每次完整下載，不讀寫儲存檔
+FORECAST_STORE_PATH = "./data/aqf_p_01.npz"
+INGEST_MODE = os.environ.get("AQI_INGEST", "incremental")
+
+# 儲存檔只保留卡片仍會用到的資料，避免每次發布後檔案持續變大：
+# 預報日期不早於「今日 - AQI_STORE_RETAIN_DAYS」，且每個 (預報日期, 縣市) 只留最新一次發布
+# (需要保留過去的預報供驗證時，調大 AQI_STORE_RETAIN_DAYS)
+STORE_RETAIN_DAYS = int(os.environ.get("AQI_STORE_RETAIN_DAYS", "0"))
+
 # SHP 中縣市名稱欄位
 SHP_NAME_COL = "COUNTYNAME"
 
@@ -51,12 +74,28 @@ LAYOUT_CONFIG = [
     {'w': 1114, 'h': 1745, 'x': 3232, 'y': 497}
 ]
 
+# 地圖繪製版面：畫布比例盡量接近目標長寬比 (1114/1745 ~ 0.638)，
+# 經緯度範圍鎖定台灣本島 (lon_min, lon_max, lat_min, lat_max)
+MAP_STYLE = MapStyle(figsize=(6.38, 10), dpi=200, extent=(119.8, 122.2, 21.8, 25.4))
+
+# 面量圖繪製方式：
+#   "index"      → 使用快取的縣市索引圖查表上色 (預設，毫秒等級)
+#   "matplotlib" → 每日以 geopandas/matplotlib 重新繪製
+#   "processes"  → 同 matplotlib，但以多個行程平行繪製各日 (預報天數多時使用)
+RENDER_MODE = os.environ.get("AQI_RENDER_MODE", "index")
+
+# "processes" 模式的行程數 (預設為 CPU 核心數，且不超過要繪製的天數)
+RENDER_PROCESSES = int(os.environ.get("AQI_RENDER_PROCESSES", "0")) or os.cpu_count() or 1
+
 # ============================================================
 # === AQI 設定 ================================================
 # ============================================================
 
 AQI_BINS   = [0, 50, 100, 150, 200, 300, 500]
 AQI_COLORS = ["#7ed957", "#fffb26", "#ff9734", "#ca0034", "#670099", "#7e0123"]
+AQI_NODATA_COLOR = "#cccccc"
+# 色彩索引 0~5 對應 AQI_COLORS，-1 (最後一色) 為無資料
+AQI_PALETTE = AQI_COLORS + [AQI_NODATA_COLOR]
 AQI_LABELS = [
     "良好 (0–50)",
     "普通 (51–100)",
@@ -82,80 +121,155 @@ AREA_TO_COUNTIES = {
 
 # ============================================================
 
-def classify_aqi(val):
-    """回傳 AQI 對應的顏色"""
-    if pd.isna(val):
-        return "#cccccc"
-    for i in range(len(AQI_BINS) - 1):
-        if AQI_BINS[i] <= val <= AQI_BINS[i + 1]:
-            return AQI_COLORS[i]
-    return "#cccccc"
+def classify_aqi(values):
+    """回傳 AQI 對應的色彩索引 (向量化；各區間含上下界，NaN 或超出範圍為 -1)"""
+    import numpy as np
+    import pandas as pd
+    codes = pd.cut(pd.Series(values, dtype=float), AQI_BINS, labels=False, include_lowest=True)
+    return codes.fillna(-1).to_numpy(np.int8)
 
-def download_csv(url):
+def download_csv(url, session=None):
+    """下載 CSV，只解析 FORECAST_COLUMNS (欄位名稱統一為小寫)"""
+    import pandas as pd
     print("正在下載 AQI 預報資料...")
-    resp = requests.get(url, timeout=30, verify=False)
+    with stage("download", url=url):
+        resp = (session or requests).get(url, timeout=30, verify=False)
+        annotate(bytes=len(resp.content), status=resp.status_code)
     resp.raise_for_status()
-    content = resp.content.decode("utf-8-sig")
-    from io import StringIO
-    df = pd.read_csv(StringIO(content))
+    if not resp.content.strip():
+        df = pd.DataFrame(columns=FORECAST_COLUMNS, dtype=object)
+    else:
+        df = pd.read_csv(
+            io.BytesIO(resp.content), encoding="utf-8-sig", dtype=str,
+            usecols=lambda c: c.strip().lower() in FORECAST_COLUMNS
+        )
+        df.columns = [c.strip().lower() for c in df.columns]
     print(f"  下載完成，共 {len(df)} 筆資料")
     return df
 
-def build_county_aqi(df_day, gdf):
-    """將當日 AQI 依 area 對應到各縣市"""
-    county_aqi = {}
-    for _, row in df_day.iterrows():
-        area = str(row["area"]).strip()
-        aqi  = row["aqi"]
-        counties = AREA_TO_COUNTIES.get(area, [area])
-        for c in counties:
-            county_aqi[c] = aqi
-
-    gdf = gdf.copy()
-    gdf["aqi_value"] = gdf[SHP_NAME_COL].map(county_aqi)
-    gdf["color"]     = gdf["aqi_value"].apply(classify_aqi)
-    return gdf
-
-def draw_transparent_map(gdf_day, output_path):
-    """繪製滿版、無邊框、透明背景的面量圖"""
-    # 設定畫布比例，盡量接近您的目標長寬比 (1114/1745 ~ 0.638)
-    fig = plt.figure(figsize=(6.38, 10), dpi=200)
-    
-    # 【關鍵】使用 add_axes 強制讓地圖填滿整個畫布，去除所有白邊與 padding
-    ax = fig.add_axes([0, 0, 1, 1], projection=None)
-
-    # 畫底圖
-    for color, group in gdf_day.groupby("color"):
-        group.plot(ax=ax, color=color, edgecolor="black", linewidth=0.5)
-
-    # 縣市邊界再疊一層
-    gdf_day.boundary.plot(ax=ax, color="#555555", linewidth=1)
-
-    # 設定經緯度範圍 (鎖定台灣本島範圍，確保每次縮放比例一致)
-    lat_min, lat_max = 21.8, 25.4
-    lon_min, lon_max = 119.8, 122.2
-    ax.set_xlim(lon_min, lon_max)
-    ax.set_ylim(lat_min, lat_max)
-    
-    # 關閉坐標軸
-    ax.set_axis_off()
-
-    # 儲存為透明背景
-    plt.savefig(output_path, dpi=200, transparent=True, bbox_inches='tight', pad_inches=0)
-    plt.close()
-
-def main():
+def ingest_forecasts(session=None):
+    """增量下載：只取得 publishtime 比儲存檔更新的資料，合併去重後寫回並回傳全部資料"""
+    import pandas as pd
+    store = load_frame(FORECAST_STORE_PATH, FORECAST_COLUMNS)
+
+    url = CSV_URL
+    if len(store):
+        last = store["publishtime"].max()
+        url += "&filters=" + quote(f"publishtime,GT,{last}")
+        print(f"已儲存 {len(store)} 筆預報，只下載 {last} 之後發布的資料")
+
+    try:
+        new = download_csv(url, session)
+    except requests.HTTPError as e:
+        if url == CSV_URL:
+            raise
+        # 帶 filters 的查詢被拒絕時，改為完整下載一次 (合併時去重)
+        print(f"  增量查詢失敗 ({e})，改為完整下載")
+        new = download_csv(CSV_URL, session)
+    new = new.reindex(columns=FORECAST_COLUMNS)
+
+    df = (
+        pd.concat([store, new], ignore_index=True)
+        .drop_duplicates(subset=["publishtime", "forecastdate", "area"], keep="last")
+        .sort_values(["publishtime", "forecastdate", "area"], ascending=False, ignore_index=True)
+    )
+    df = prune_forecasts(df)
+    if not df.equals(store):
+        save_frame(FORECAST_STORE_PATH, df, FORECAST_COLUMNS)
+        print(f"  儲存檔共 {len(df)} 筆 (原 {len(store)} 筆)")
+    return df
+
+def prune_forecasts(df, today=None):
+    """
+    只保留卡片仍會讀取的預報 (依 publishtime 由新到舊排序後呼叫)：
+    預報日期不早於 today - STORE_RETAIN_DAYS，且每個 (預報日期, 縣市) 只留最新一次發布
+    """
+    import pandas as pd
+    today = today or datetime.now().date()
+    cutoff = today - timedelta(days=STORE_RETAIN_DAYS)
+    dates = pd.to_datetime(df["forecastdate"], errors="coerce").dt.date
+    keep = (dates >= cutoff).fillna(False).astype(bool)
+    df = df[keep.to_numpy()]
+    return df.drop_duplicates(subset=["forecastdate", "area"], keep="first").reset_index(drop=True)
+
+def build_aqi_matrix(df, target_dates, counties):
+    """
+    一次計算所有目標日期各縣市的 AQI 色彩索引
+    回傳 (codes, has_data)：
+      codes    → (日期 × 縣市) 的 int8 矩陣，縣市順序同 counties，-1 為無資料
+      has_data → 各日期是否有預報資料
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = df[df["forecastdate"].isin(target_dates)]
+    if "publishtime" in df.columns:
+        # 同一天同一區只保留最新發布的預報
+        df = (
+            df.sort_values("publishtime", ascending=False)
+            .drop_duplicates(subset=["forecastdate", "area"])
+        )
+
+    # area → 縣市 (展開後的對應表；不在表中的 area 視為縣市名稱本身)
+    area_table = pd.Series(AREA_TO_COUNTIES, name="county").explode().rename_axis("area").reset_index()
+    rows = pd.DataFrame({
+        "forecastdate": df["forecastdate"].to_numpy(),
+        "area": df["area"].astype(str).str.strip().to_numpy(),
+        "aqi": df["aqi"].to_numpy(),
+    }).merge(area_table, on="area", how="left")
+    rows["county"] = rows["county"].fillna(rows["area"])
+
+    date_idx = pd.Index(target_dates).get_indexer(rows["forecastdate"])
+    county_idx = pd.Index(counties).get_indexer(rows["county"])
+    found = county_idx >= 0
+
+    codes = np.full((len(target_dates), len(counties)), -1, np.int8)
+    codes[date_idx[found], county_idx[found]] = classify_aqi(rows["aqi"])[found]
+    has_data = np.isin(np.arange(len(target_dates)), date_idx)
+    return codes, has_data
+
+def draw_transparent_map(gdf, colors, size):
+    """繪製滿版、無邊框、透明背景的面量圖，直接回傳 size 大小的 RGBA Image"""
+    return draw_choropleth(gdf, colors, size, MAP_STYLE)
+
+def load_counties(size):
+    """讀取縣市幾何 (已預處理：EPSG:4326、依 size 的像素解析度簡化，SHP 變更時自動重建)"""
+    return load_county_geometry(SHP_PATH, SHP_NAME_COL, size, MAP_STYLE)
+
+def load_index_map(size):
+    """取得 size 大小的縣市索引圖 (快取；只有重建時才需要 geopandas/matplotlib)"""
+    return load_county_index_map(SHP_PATH, SHP_NAME_COL, size, MAP_STYLE)
+
+def card_inputs(df, target_dates):
+    """合成圖的輸入 (與 manifest 紀錄相同時可略過重新產生)"""
+    published = df["publishtime"].dropna().astype(str) if "publishtime" in df.columns else []
+    return {
+        "publishtime": max(published, default=None),
+        "target_dates": [str(d) for d in target_dates],
+        "layout": config_digest([LAYOUT_CONFIG, MAP_STYLE, AQI_BINS, AQI_PALETTE, AREA_TO_COUNTIES, RENDER_MODE]),
+        "base_map": file_digest(BASE_IMAGE_PATH),
+        "counties": source_hash(SHP_PATH),
+        "encoding": encoding_inputs(),
+    }
+
+def main(session=None, force=False):
+    """
+    session 可由多產品執行器 (python -m seanforecast run) 傳入共用
+    force=True 時忽略 manifest，一律重新產生
+    """
+    import pandas as pd
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    # ── 1. 載入底圖 ──
+    # ── 1. 確認底圖存在 ──
     if not os.path.exists(BASE_IMAGE_PATH):
         print(f"嚴重錯誤: 找不到底圖 {BASE_IMAGE_PATH}")
         return
-    base_img = Image.open(BASE_IMAGE_PATH).convert("RGBA")
 
     # ── 2. 下載並讀取 CSV ──
-    df = download_csv(CSV_URL)
-    df.columns = [c.strip().lower() for c in df.columns]
+    if INGEST_MODE == "full":
+        df = download_csv(CSV_URL, session)
+    else:
+        df = ingest_forecasts(session)
 
     df["forecastdate"] = pd.to_datetime(df["forecastdate"]).dt.date
     df["aqi"]          = pd.to_numeric(df["aqi"], errors="coerce")
@@ -165,57 +279,77 @@ def main():
     target_dates = [today + timedelta(days=d) for d in range(1, 4)]
     print(f"\n執行日期：{today}，將繪製：{[str(d) for d in target_dates]}\n")
 
-    # ── 4. 讀取 SHP ──
-    print("正在載入 SHP 檔案...")
-    gdf = gpd.read_file(SHP_PATH, encoding="utf-8")
-    if gdf.crs is None or gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-
-    # ── 5. 逐日繪圖與疊圖 ──
+    # 預報發布時間、日期、版面與底圖皆未變動時略過 (不繪圖)
+    final_path = os.path.join(OUTPUT_DIR, FINAL_OUTPUT_NAME)
+    inputs = card_inputs(df, target_dates)
+    if manifest.is_current(final_path, inputs, force):
+        print("輸入皆未變動，略過產生 (可用 --force 強制重新產生)")
+        return
+    base_img = load_base_map(BASE_IMAGE_PATH)
+
+    # ── 4. 讀取縣市幾何 (索引圖模式只在需要重建索引時讀取) ──
+    first_size = (LAYOUT_CONFIG[0]['w'], LAYOUT_CONFIG[0]['h'])
+    with stage("geometry"):
+        if RENDER_MODE in ("matplotlib", "processes"):
+            gdf = load_counties(first_size)
+            counties = list(gdf[SHP_NAME_COL])
+        else:
+            counties = load_index_map(first_size).names
+
+    # ── 5. 一次分類所有日期：(日期 × 縣市) 色彩索引矩陣 ──
+    aqi_codes, has_data = build_aqi_matrix(df, target_dates, counties)
+    palette = palette_rgba(AQI_PALETTE)
+
+    # 無預報資料的日期略過
+    days = []
     for i, target_date in enumerate(target_dates):
-        df_day = df[df["forecastdate"] == target_date]
-        if df_day.empty:
+        if has_data[i]:
+            days.append(i)
+        else:
             print(f"警告：{target_date} 無預報資料，略過該日。")
-            continue
 
-        if "publishtime" in df_day.columns:
-            df_day = (
-                df_day.sort_values("publishtime", ascending=False)
-                .drop_duplicates(subset=["area"])
+    # 多行程模式：各日同時繪製，結果經共享記憶體交回，再由本行程依序疊圖
+    rendered = {}
+    if RENDER_MODE == "processes" and days:
+        print(f"正在以 {min(RENDER_PROCESSES, len(days))} 個行程平行產生面量圖...")
+        jobs = [
+            ([AQI_PALETTE[c] for c in aqi_codes[i]], (LAYOUT_CONFIG[i]['w'], LAYOUT_CONFIG[i]['h']))
+            for i in days
+        ]
+        with stage("render"):
+            images = render_choropleths(
+                SHP_PATH, SHP_NAME_COL, first_size, MAP_STYLE, jobs, RENDER_PROCESSES
             )
+        rendered = dict(zip(days, images))
+
+    # ── 6. 逐日繪圖與疊圖 ──
+    for i in days:
+        target_date = target_dates[i]
+
+        # 讀取您的尺寸與座標設定 (地圖直接繪製為目標尺寸，不需暫存檔與縮放)
+        cfg = LAYOUT_CONFIG[i]
+        target_size = (cfg['w'], cfg['h'])
+        paste_pos = (cfg['x'], cfg['y'])
 
-        gdf_day = build_county_aqi(df_day, gdf)
-        
-        # 產生暫存的透明地圖
-        temp_png = os.path.join(OUTPUT_DIR, f"temp_aqi_{i}.png")
         print(f"正在產生 {target_date} 面量圖...")
-        draw_transparent_map(gdf_day, temp_png)
-
-        # 讀取暫存圖並疊加至大底圖
-        if os.path.exists(temp_png):
-            overlay_img = Image.open(temp_png).convert("RGBA")
-            
-            # 讀取您的尺寸與座標設定
-            cfg = LAYOUT_CONFIG[i]
-            target_size = (cfg['w'], cfg['h'])
-            paste_pos = (cfg['x'], cfg['y'])
-            
-            # 縮放影像 (LANCZOS 演算法畫質最佳)
-            overlay_resized = overlay_img.resize(target_size, Image.Resampling.LANCZOS)
-            
-            # 將縮放後的地圖貼到底圖上
-            base_img.paste(overlay_resized, paste_pos, overlay_resized)
-            print(f"  ✓ {target_date} 已合成至底圖。")
-            
-            # 刪除暫存檔 (可依需求決定是否保留)
-            os.remove(temp_png)
-
-    # ── 6. 儲存最終合成圖 ──
-    final_path = os.path.join(OUTPUT_DIR, FINAL_OUTPUT_NAME)
-    base_img.save(final_path)
+        with stage("render"):
+            if i in rendered:
+                overlay_img = rendered[i]
+            elif RENDER_MODE == "matplotlib":
+                colors = pd.Series([AQI_PALETTE[c] for c in aqi_codes[i]], index=gdf.index)
+                overlay_img = draw_transparent_map(gdf, colors, target_size)
+            else:
+                overlay_img = load_index_map(target_size).render(aqi_codes[i], palette)
+
+        # 將地圖貼到底圖上
+        with stage("composite"):
+            base_img.paste(overlay_img, paste_pos, overlay_img)
+        print(f"  ✓ {target_date} 已合成至底圖。")
+
+    # ── 7. 儲存最終合成圖 ──
+    save_output(base_img, final_path)
+    manifest.record(final_path, inputs)
     print(f"\n🎉 全部完成！最終合成圖已儲存至：{final_path}")
 
 if __name__ == "__main__":
-    plt.rcParams["font.family"] = ["Microsoft JhengHei", "sans-serif"]
-    plt.rcParams["axes.unicode_minus"] = False
-    main()
\ No newline at end of file
+    main(force="--force" in sys.argv[1:])
\ No newline at end of file
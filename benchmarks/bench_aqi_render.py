@@ -0,0 +1,76 @@
+"""
+AQI 面量圖 matplotlib 繪圖基準測試：逐日繪製 vs 多行程平行繪製
+以隨機 AQI 等級繪製 N 天，比較不同行程數的總時間 (需要 repo 根目錄的縣市 SHP)
+
+使用方式 (於 repo 根目錄):
+    python benchmarks/bench_aqi_render.py [--days N] [--processes 1,2,4] [--json 輸出檔]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.chdir(REPO_DIR)
+
+import pandas as pd  # noqa: E402
+
+import AQI_forecast as aqi  # noqa: E402
+from seanforecast.render_pool import render_choropleths  # noqa: E402
+
+
+def make_jobs(days, n_counties, seed=0):
+    """每天隨機指定各縣市的 AQI 等級 (含無資料)，尺寸沿用第一天的版面"""
+    rng = np.random.default_rng(seed)
+    size = (aqi.LAYOUT_CONFIG[0]['w'], aqi.LAYOUT_CONFIG[0]['h'])
+    return [
+        ([aqi.AQI_PALETTE[c] for c in rng.integers(-1, len(aqi.AQI_COLORS), n_counties)], size)
+        for _ in range(days)
+    ]
+
+
+def run_sequential(gdf, jobs):
+    for colors, size in jobs:
+        aqi.draw_transparent_map(gdf, pd.Series(colors, index=gdf.index), size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=7, help="要繪製的天數")
+    parser.add_argument("--processes", default=f"1,2,{os.cpu_count() or 1}", help="以逗號分隔的行程數")
+    parser.add_argument("--json", help="將結果輸出為 JSON 檔")
+    args = parser.parse_args()
+
+    size = (aqi.LAYOUT_CONFIG[0]['w'], aqi.LAYOUT_CONFIG[0]['h'])
+    gdf = aqi.load_counties(size)
+    jobs = make_jobs(args.days, len(gdf))
+
+    results = {}
+    t0 = time.perf_counter()
+    run_sequential(gdf, jobs)
+    results["sequential"] = time.perf_counter() - t0
+    print(f"{'逐日繪製':<12}{results['sequential']:8.2f} s")
+
+    for n in sorted({int(p) for p in args.processes.split(",")}):
+        t0 = time.perf_counter()
+        render_choropleths(aqi.SHP_PATH, aqi.SHP_NAME_COL, size, aqi.MAP_STYLE, jobs, n)
+        results[f"processes={n}"] = time.perf_counter() - t0
+        speedup = results["sequential"] / results[f"processes={n}"]
+        print(f"{f'{n} 個行程':<12}{results[f'processes={n}']:8.2f} s   ({speedup:.2f}x，含行程啟動)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": sys.version.split()[0], "cpu_count": os.cpu_count(), "days": args.days,
+                "seconds": {k: round(v, 3) for k, v in results.items()},
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n已輸出: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+多行程合成 (seanforecast/composite_pool.py) 與原行程內依序合成的比較
+以本機替身 (benchmarks/standin.py) 的範例面板合成 2 天與 7 天預報的各張底圖，
+檢查行程池的結果與原行程內合成逐位元組相同 (2 天預報的 ecmwf_wrf 與 gfs_fnv3 版面重疊)，並比較時間
+
+使用方式 (於 repo 根目錄):
+    python benchmarks/bench_composite_pool.py [--processes N] [--repeat N]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from seanforecast.basemap import load_base_map  # noqa: E402
+from seanforecast.compose import WHITE_THRESHOLD, compile_panel, composite_panel, make_white_transparent  # noqa: E402
+from seanforecast.composite_pool import CompositePool, SharedCanvas  # noqa: E402
+from seanforecast.fetch import decode_image  # noqa: E402
+from seanforecast.runner import load_product  # noqa: E402
+from standin import sample_panel  # noqa: E402
+
+
+def card_jobs():
+    """{卡片名稱: (底圖, [(範例面板內容, 面板設定, 去白底閥值)])}，面板依腳本中的合成順序"""
+    two_day = load_product("2day")
+    seven_day = load_product("7day")
+    cards = {}
+    for base_map in (two_day.BASE_MAP_TOMORROW, two_day.BASE_MAP_DAYAFTER):
+        cards[os.path.basename(base_map)] = (base_map, [
+            (sample_panel("/" + cfg['img_template'].rsplit("/", 1)[-1]), cfg, cfg.get('white_threshold', WHITE_THRESHOLD))
+            for cfg in two_day.MODELS.values()
+        ])
+    for base_idx, (base_map, _) in seven_day.CARDS.items():
+        cards[os.path.basename(base_map)] = (base_map, [
+            (sample_panel(f"/ecwrf_rain_f{day:02d}.png"), cfg, cfg.get('white_threshold', WHITE_THRESHOLD))
+            for day, cfg in sorted(seven_day.LAYOUT_CONFIGS.items()) if cfg['base'] == base_idx
+        ])
+    return cards
+
+
+def composite_in_process(base_map, jobs):
+    canvas = load_base_map(base_map)
+    for content, cfg, threshold in jobs:
+        img = make_white_transparent(decode_image(content), threshold)
+        panel = compile_panel(cfg['layout'], cfg['masks'], keep_box=cfg.get('keep_box'))
+        composite_panel(canvas, img, panel, cfg.get('resample'))
+    return np.array(canvas)
+
+
+def composite_in_pool(pool, base_map, jobs):
+    shared = SharedCanvas(base_map)
+    try:
+        futures = [pool.submit(shared, content, cfg, threshold) for content, cfg, threshold in jobs]
+        assert all(f.result() for f in futures)
+        img = shared.image()
+        data = np.array(img)
+        del img
+        return data
+    finally:
+        shared.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=max(os.cpu_count() or 1, 4))
+    parser.add_argument("--repeat", type=int, default=5, help="每張卡片以行程池合成的次數 (重複檢查結果是否一致)")
+    args = parser.parse_args()
+
+    cards = card_jobs()
+    print(f"{'卡片':<36}{'原行程 (s)':>12}{'行程池 (s)':>12}  結果")
+    with CompositePool(args.processes) as pool:
+        # 先讓 worker 行程啟動 (不計入時間)
+        composite_in_pool(pool, *next(iter(cards.values())))
+        for name, (base_map, jobs) in cards.items():
+            t0 = time.perf_counter()
+            expected = composite_in_process(base_map, jobs)
+            local_seconds = time.perf_counter() - t0
+
+            pool_seconds = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                actual = composite_in_pool(pool, base_map, jobs)
+                pool_seconds.append(time.perf_counter() - t0)
+                assert np.array_equal(expected, actual), f"{name}: 行程池的結果與原行程內合成不同"
+            print(f"{name:<36}{local_seconds:>12.2f}{min(pool_seconds):>12.2f}  相同 ×{args.repeat}")
+
+
+if __name__ == "__main__":
+    main()
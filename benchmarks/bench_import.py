@@ -0,0 +1,84 @@
+"""
+啟動時間 (import time) 基準測試
+以 `python -X importtime` 在全新的子行程中載入各產品腳本，統計 import 總時間與最慢的模組
+
+使用方式 (於 repo 根目錄):
+    python benchmarks/bench_import.py [--top N] [--json 輸出檔]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 要測量的情境：名稱 → 子行程執行的程式碼
+SCENARIOS = {
+    "7day (載入腳本)": "from seanforecast.runner import load_product; load_product('7day')",
+    "2day (載入腳本)": "from seanforecast.runner import load_product; load_product('2day')",
+    "aqi (載入腳本)": "from seanforecast.runner import load_product; load_product('aqi')",
+    "aqi (繪圖階段)": (
+        "from seanforecast.fonts import setup_matplotlib; setup_matplotlib(); "
+        "import pandas, geopandas"
+    ),
+}
+
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(code):
+    """回傳 (總秒數, import 總微秒, [(累計微秒, 模組)])"""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_DIR, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    total_us = 0
+    modules = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), m.group(3), m.group(4)
+        # 只有最外層 (縮排一格) 的 import 計入總時間，避免重複計算
+        if len(indent) == 1:
+            total_us += cumulative
+            modules.append((cumulative, name))
+    modules.sort(reverse=True)
+    return wall, total_us, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=5, help="列出最慢的前 N 個模組")
+    parser.add_argument("--json", help="將結果輸出為 JSON 檔")
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in SCENARIOS.items():
+        wall, total_us, modules = measure(code)
+        results[name] = {
+            "wall_ms": round(wall * 1000, 1),
+            "import_ms": round(total_us / 1000, 1),
+            "top": [{"module": m, "ms": round(us / 1000, 1)} for us, m in modules[:args.top]],
+        }
+        print(f"{name:<16} 行程 {wall * 1000:8.1f} ms   import {total_us / 1000:8.1f} ms")
+        for us, m in modules[:args.top]:
+            print(f"    {m:<32}{us / 1000:8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n已輸出: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
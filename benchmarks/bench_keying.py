@@ -0,0 +1,121 @@
+"""
+去白底 (make_white_transparent) 微基準測試
+比較舊版 (三次比較 + 多次複製) 與 seanforecast.compose 的原地版本；
+調色盤來源 (GIF 等) 另列出直接處理調色盤 (不展開為 RGBA) 的時間
+
+使用方式 (於 repo 根目錄):
+    python benchmarks/bench_keying.py [--repeat N] [圖片路徑 ...]
+
+未指定圖片時，優先使用影像快取 (.cache/images) 中實際下載過的 NCDR 面板；
+快取為空時，改用近似 NCDR 面板尺寸的合成影像 (建議先正常執行一次腳本以取得實際面板)
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seanforecast.cache import IMAGE_CACHE_DIR  # noqa: E402
+from seanforecast.compose import make_white_transparent  # noqa: E402
+
+# 影像快取為空時使用的近似面板尺寸 (寬, 高)
+FALLBACK_SIZES = {
+    "ecwrf_rain (png)": (1000, 1720),
+    "O01_d12s (gif)": (900, 1200),
+    "rain_2weeks (gif)": (1300, 1700),
+    "jmamsrn (png)": (1200, 1800),
+}
+
+
+def legacy_make_white_transparent(img, threshold=220):
+    """原本兩支腳本中的版本，作為比較基準"""
+    img = img.convert("RGBA")
+    data = np.array(img)
+    r, g, b, a = data[:,:,0], data[:,:,1], data[:,:,2], data[:,:,3]
+    white_mask = (r > threshold) & (g > threshold) & (b > threshold)
+    data[..., 3][white_mask] = 0
+    return Image.fromarray(data)
+
+
+def cached_panels():
+    """影像快取中的面板 {檔名: 路徑} (以原始 URL 的檔名命名)"""
+    try:
+        with open(os.path.join(IMAGE_CACHE_DIR, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    panels = {}
+    for url, entry in index.items():
+        digest = entry["blob"]
+        panels[url.rsplit("/", 1)[-1]] = os.path.join(IMAGE_CACHE_DIR, digest[:2], digest)
+    return panels
+
+
+def load_samples(paths):
+    """{名稱: (RGBA 影像, 原始調色盤影像或 None)}"""
+    named = {os.path.basename(p): p for p in paths} if paths else cached_panels()
+    samples = {}
+    for name, path in sorted(named.items()):
+        try:
+            img = Image.open(path)
+            img.load()
+        except Exception:
+            continue
+        palette = img if img.mode == "P" else None
+        samples[f"{name[:26]} {img.size[0]}x{img.size[1]}"] = (img.convert("RGBA"), palette)
+    if samples:
+        return samples
+
+    rng = np.random.default_rng(0)
+    for name, (w, h) in FALLBACK_SIZES.items():
+        data = np.full((h, w, 4), 255, np.uint8)
+        data[..., :3] = np.where(rng.random((h, w, 1)) < 0.4, rng.integers(0, 256, (h, w, 3)), 255)
+        img = Image.fromarray(data, "RGBA")
+        palette = img.convert("RGB").quantize(64) if "gif" in name else None
+        samples[f"{name} {w}x{h}"] = (palette.convert("RGBA") if palette else img, palette)
+    return samples
+
+
+def timeit(func, img, threshold, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(img, threshold)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="要測試的面板圖片")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--threshold", type=int, default=220)
+    args = parser.parse_args()
+
+    print(f"{'面板':<36}{'舊版 (ms)':>12}{'新版 (ms)':>12}{'加速':>8}{'調色盤 (ms)':>14}")
+    for name, (img, palette_img) in load_samples(args.paths).items():
+        expected = np.asarray(legacy_make_white_transparent(img, args.threshold))
+        actual = np.asarray(make_white_transparent(img, args.threshold))
+        assert np.array_equal(expected, actual), f"{name}: 結果與舊版不一致"
+
+        legacy_ms = timeit(legacy_make_white_transparent, img, args.threshold, args.repeat)
+        new_ms = timeit(make_white_transparent, img, args.threshold, args.repeat)
+        line = f"{name:<36}{legacy_ms:>12.2f}{new_ms:>12.2f}{legacy_ms / new_ms:>7.1f}x"
+
+        # 調色盤路徑：展開為 RGBA 後必須與逐像素處理完全相同
+        if palette_img is not None:
+            keyed = make_white_transparent(palette_img, args.threshold)
+            assert np.array_equal(expected, np.asarray(keyed.convert("RGBA"))), f"{name}: 調色盤結果不一致"
+            palette_ms = timeit(make_white_transparent, palette_img, args.threshold, args.repeat)
+            line += f"{palette_ms:>14.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+離線端對端基準測試：以本機替身 (benchmarks/standin.py) 取代 NCDR / MOENV，
+逐一在獨立子行程中執行各產品，統計各處理階段 (初始時間查詢、下載、去白底、縮放、遮罩、合成、編碼…)
+的時間與子行程的峰值記憶體 (RSS)，結果可輸出為 JSON 供跨 commit 比較
+
+每個產品使用全新的暫存快取目錄 (冷啟動)；加上 --warm 會在同一快取目錄再執行一次 (熱快取)
+輸出圖、manifest、AQI 儲存檔都寫到暫存目錄，不會動到 repo 內的 outputs/
+
+使用方式 (於 repo 根目錄):
+    python benchmarks/bench_pipeline.py [--products 7day,2day,aqi] [--warm] [--latency MS]
+                                        [--straggler-rate R] [--error-rate R] [--json 輸出檔]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import traceback
+import subprocess
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def peak_rss_mb():
+    """本行程的峰值 RSS (MB)；不支援的平台回傳 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 byte
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_child(name, base_url, workdir, result_path):
+    """(子行程) 以本機替身執行單一產品，結果寫入 result_path"""
+    sys.path[:0] = [REPO_DIR, BENCH_DIR]
+    os.chdir(REPO_DIR)
+    from standin import mount_standin
+    from seanforecast import stages
+    from seanforecast.manifest import RunManifest
+    from seanforecast.runner import SharedContext, load_product
+
+    t0 = time.perf_counter()
+    module = load_product(name)
+    load_seconds = time.perf_counter() - t0
+
+    # 所有寫入都導向暫存目錄
+    module.OUTPUT_DIR = os.path.join(workdir, "Output")
+    os.makedirs(module.OUTPUT_DIR, exist_ok=True)
+    module.manifest = RunManifest(os.path.join(workdir, "manifest.json"))
+    if hasattr(module, "FORECAST_STORE_PATH"):
+        module.FORECAST_STORE_PATH = os.path.join(workdir, "aqf_p_01.npz")
+
+    context = SharedContext(force=True)
+    mount_standin(context.session, base_url)
+    stages.enable()
+    error = None
+    t0 = time.perf_counter()
+    try:
+        module.main(**context.product_kwargs(name))
+    except Exception:
+        error = traceback.format_exc().strip().splitlines()[-1]
+    finally:
+        context.close()
+    wall = time.perf_counter() - t0
+
+    outputs = sorted(os.listdir(module.OUTPUT_DIR))
+    result = {
+        "ok": error is None and bool(outputs),
+        "error": error,
+        "load_seconds": round(load_seconds, 4),
+        "wall_seconds": round(wall, 4),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages.snapshot(),
+        "outputs": {f: os.path.getsize(os.path.join(module.OUTPUT_DIR, f)) for f in outputs},
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+def measure(name, base_url, workdir, verbose=False):
+    """在子行程中執行一次產品，回傳結果 dict"""
+    result_path = os.path.join(workdir, f"result_{name}.json")
+    env = dict(os.environ, SEANFORECAST_CACHE_DIR=os.path.join(workdir, ".cache"))
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", name,
+         "--base-url", base_url, "--workdir", workdir, "--result", result_path],
+        cwd=REPO_DIR, env=env, capture_output=not verbose, text=True
+    )
+    try:
+        with open(result_path, encoding="utf-8") as f:
+            return json.load(f)
+    except OSError:
+        tail = (proc.stderr or "").strip().splitlines()[-1:] or [f"結束代碼 {proc.returncode}"]
+        return {"ok": False, "error": tail[0], "stages": {}}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(name, label, r):
+    if not r.get("ok"):
+        print(f"{name:<6}{label:<6}失敗: {r.get('error')}")
+        return
+    print(f"{name:<6}{label:<6}{r['wall_seconds']:8.2f} s   峰值 RSS {r['peak_rss_mb']} MB   (載入腳本 {r['load_seconds']:.2f} s)")
+    for stage_name, s in r["stages"].items():
+        print(f"    {stage_name:<12}{s['seconds']:8.3f} s  × {s['count']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", default="7day,2day,aqi", help="以逗號分隔的產品清單")
+    parser.add_argument("--warm", action="store_true", help="另外測量熱快取 (第二次執行)")
+    parser.add_argument("--latency", type=float, default=0.0, help="本機替身每個請求的額外延遲 (毫秒)")
+    parser.add_argument("--straggler-rate", type=float, default=0.0, help="影像請求額外延遲的機率 (0~1)")
+    parser.add_argument("--straggler-delay", type=float, default=3.0, help="落後請求的額外延遲 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="影像請求回應 503 的機率 (0~1)")
+    parser.add_argument("--json", help="將結果輸出為 JSON 檔")
+    parser.add_argument("--verbose", action="store_true", help="顯示產品腳本的輸出")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.base_url, args.workdir, args.result)
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    from standin import StandInServer
+
+    server = StandInServer(
+        latency=args.latency / 1000, straggler_rate=args.straggler_rate,
+        straggler_delay=args.straggler_delay, error_rate=args.error_rate
+    ).start()
+    results = {}
+    try:
+        for name in [p.strip() for p in args.products.split(",") if p.strip()]:
+            with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as workdir:
+                runs = {"cold": measure(name, server.base_url, workdir, args.verbose)}
+                if args.warm:
+                    runs["warm"] = measure(name, server.base_url, workdir, args.verbose)
+            results[name] = runs
+            for label, r in runs.items():
+                print_result(name, label, r)
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": git_commit(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "latency_ms": args.latency,
+                "straggler_rate": args.straggler_rate,
+                "straggler_delay": args.straggler_delay,
+                "error_rate": args.error_rate,
+                "http_requests": server.requests,
+                "products": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n已輸出: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+面板縮放方式 (seanforecast.compose.RESAMPLE_POLICIES) 的速度與畫質比較
+每張面板先依腳本設定去白底，再以各方式縮放到實際卡片上的面板大小；
+畫質以 LANCZOS (原本的方式) 的結果為基準，疊在白底上比較 PSNR 與 SSIM (亮度、7x7 視窗)
+
+使用方式 (於 repo 根目錄):
+    python benchmarks/bench_resample.py [--repeat N] [--policies lanczos,bicubic,...] [圖片路徑 ...]
+
+未指定圖片時，優先使用影像快取 (.cache/images) 中實際下載過的 NCDR 面板；
+快取為空時，改用本機替身 (benchmarks/standin.py) 產生的範例面板
+"""
+
+import io
+import os
+import sys
+import argparse
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seanforecast.compose import RESAMPLE_POLICIES, make_white_transparent, resize_panel  # noqa: E402
+from bench_keying import cached_panels  # noqa: E402
+from standin import sample_panel  # noqa: E402
+
+# 檔名開頭 → 卡片上的面板大小 (寬, 高) 與去白底閥值 (取自 7daysforecast.py / 2daysdorecast.py 的設定)
+PANEL_TARGETS = {
+    "ecwrf_rain": ((946, 1628), 220),
+    "O01_": ((904, 1629), 200),
+    "rain_": ((1318, 1722), 200),
+    "jmamsrn": ((1139, 1700), 200),
+}
+
+# 快取為空時使用的範例面板 (檔名與實際 NCDR 面板相同)
+FALLBACK_NAMES = [
+    "ecwrf_rain_2026022112_f01.png",
+    "O01_2026022109_f15_d12s.gif",
+    "rain_202602211200_f01.gif",
+    "jmamsrn_2026022112_01.png",
+]
+
+
+def panel_target(name, size):
+    for prefix, target in PANEL_TARGETS.items():
+        if name.startswith(prefix):
+            return target
+    return (round(size[0] * 0.95), round(size[1] * 0.95)), 220
+
+
+def load_samples(paths):
+    """{檔名: 解碼後的影像 (與 download_image 相同：調色盤影像維持 "P")}"""
+    named = {os.path.basename(p): p for p in paths} if paths else cached_panels()
+    samples = {}
+    for name, path in sorted(named.items()):
+        try:
+            img = Image.open(path)
+            img.load()
+        except Exception:
+            continue
+        samples[name] = img if img.mode == "P" else img.convert("RGBA")
+    if samples:
+        return samples
+
+    for name in FALLBACK_NAMES:
+        img = Image.open(io.BytesIO(sample_panel("/" + name)))
+        img.load()
+        samples[name] = img if img.mode == "P" else img.convert("RGBA")
+    return samples
+
+
+def on_white(img):
+    """RGBA 疊在白底上 (卡片上看到的樣子)，回傳 float RGB 陣列"""
+    data = np.asarray(img, dtype=np.float64)
+    alpha = data[..., 3:] / 255
+    return data[..., :3] * alpha + 255 * (1 - alpha)
+
+
+def psnr(a, b):
+    mse = np.mean((a - b) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def _box_mean(x, k):
+    """k×k 視窗的平均 (只取完整視窗)，以積分影像計算"""
+    c = np.pad(x, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+
+def ssim(a, b, k=7):
+    """亮度的平均 SSIM (均勻 k×k 視窗)"""
+    weights = np.array([0.299, 0.587, 0.114])
+    x, y = a @ weights, b @ weights
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mx, my = _box_mean(x, k), _box_mean(y, k)
+    vx = _box_mean(x * x, k) - mx * mx
+    vy = _box_mean(y * y, k) - my * my
+    cov = _box_mean(x * y, k) - mx * my
+    s = ((2 * mx * my + c1) * (2 * cov + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(s.mean())
+
+
+def timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="面板圖片 (預設使用影像快取)")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--policies", default=",".join(RESAMPLE_POLICIES), help="以逗號分隔的縮放方式")
+    args = parser.parse_args()
+    policies = [p.strip() for p in args.policies.split(",") if p.strip()]
+
+    print(f"{'面板':<34}{'方式':<16}{'時間 (ms)':>10}{'加速':>8}{'PSNR (dB)':>11}{'SSIM':>9}")
+    for name, img in load_samples(args.paths).items():
+        size, threshold = panel_target(name, img.size)
+        keyed = make_white_transparent(img, threshold)
+        label = f"{name[:20]} → {size[0]}x{size[1]}"
+
+        base_ms, reference = timeit(lambda: resize_panel(keyed, size, "lanczos"), args.repeat)
+        reference = on_white(reference)
+        for policy in policies:
+            ms, resized = timeit(lambda: resize_panel(keyed, size, policy), args.repeat)
+            actual = on_white(resized)
+            print(f"{label:<34}{policy:<16}{ms:>10.2f}{base_ms / ms:>7.1f}x"
+                  f"{psnr(reference, actual):>11.2f}{ssim(reference, actual):>9.4f}")
+            label = ""
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+NCDR 與 MOENV 端點的本機替身 (離線基準測試用)
+在 127.0.0.1 上提供：
+- list_realtime_date_csv.php 的初始時間回應 (依 v= 參數)
+- 所有 img_template 的範例 PNG / GIF 面板 (依網址產生，內容固定)
+- aqf_p_01 的 AQI 預報 CSV (預報日期以今天為準，支援 filters=publishtime,GT,...)
+
+產品腳本不需修改：以 StandInAdapter 掛在 Session 上，把原本的 https 網址改寫到本機伺服器
+"""
+
+import io
+import random
+import hashlib
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import requests
+from PIL import Image
+
+# 要改寫到本機的主機
+HOSTS = ["watch.ncdr.nat.gov.tw", "data.moenv.gov.tw"]
+
+# list_realtime_date_csv.php 的回應 (v= 參數 → 內容)；格式同 NCDR 實際回應 "KEY_date,YYYYMMDDHHmm"
+INIT_TIME_RESPONSES = {
+    "CHART_ECMWF_WRFDS": "CHART_ECMWF_WRFDS_date,202602211200",
+    "CWB_QPF_OFFICIAL": "CWB_QPF_OFFICIAL_date,202602210900",
+    "WRF2WEEKS_RAIN": "WRF2WEEKS_RAIN_date,202602211200",
+}
+
+# 範例面板尺寸 (寬, 高)：依副檔名
+PANEL_SIZES = {".png": (1000, 1720), ".gif": (900, 1200)}
+
+AQI_AREAS = ["北部", "竹苗", "宜蘭", "中部", "雲嘉南", "高屏", "花東", "澎湖", "金門", "馬祖"]
+AQI_PUBLISH_TIMES = ["2026-02-21 10:30", "2026-02-21 16:30"]
+
+
+def sample_panel(path):
+    """依網址路徑產生固定內容的預報面板：白底 + 色塊 + 格線 (接近實際圖面的去白底/壓縮特性)"""
+    ext = path[path.rfind("."):].lower()
+    w, h = PANEL_SIZES.get(ext, PANEL_SIZES[".png"])
+    rng = np.random.default_rng(int(hashlib.md5(path.encode()).hexdigest()[:8], 16))
+    data = np.full((h, w, 3), 255, np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, w - 100), rng.integers(0, h - 100)
+        data[y:y + rng.integers(20, 300), x:x + rng.integers(20, 300)] = rng.integers(0, 256, 3)
+    data[::37, :] = 230
+
+    img = Image.fromarray(data, "RGB")
+    buf = io.BytesIO()
+    if ext == ".gif":
+        img.quantize(64).save(buf, "GIF")
+    else:
+        img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def aqi_csv(after=None):
+    """AQI 預報 CSV (今天起 4 天 × 各區 × 各發布時間)；after 為 publishtime 下限 (不含)"""
+    today = date.today()
+    rows = ["content,publishtime,area,majorpollutant,forecastdate,aqi,minorpollutant,minorpollutantaqi"]
+    for pub in AQI_PUBLISH_TIMES:
+        if after and pub <= after:
+            continue
+        for d in range(4):
+            for i, area in enumerate(AQI_AREAS):
+                aqi = (i * 37 + d * 23) % 260
+                rows.append(f"-,{pub},{area},PM2.5,{today + timedelta(days=d)},{aqi},,")
+    return ("\ufeff" + "\n".join(rows)).encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        body, ctype = self.server.respond(parts.path, query)
+        if body == 503:
+            self.send_error(503)
+            return
+        if body is None:
+            self.send_error(404)
+            return
+
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    本機替身伺服器 (背景執行緒)
+    latency 為每個請求額外延遲的秒數；另可模擬影像請求的落後者 (straggler_rate 的機率再延遲
+    straggler_delay 秒) 與暫時性錯誤 (error_rate 的機率回應 503)，用來測量重試與對沖請求
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, straggler_rate=0.0, straggler_delay=3.0, error_rate=0.0, seed=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.straggler_rate = straggler_rate
+        self.straggler_delay = straggler_delay
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+        self._panels = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def respond(self, path, query):
+        """path 為 "/<原主機>/<原路徑>"，回傳 (內容, Content-Type)；找不到時內容為 None"""
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+        if path.endswith("list_realtime_date_csv.php"):
+            body = INIT_TIME_RESPONSES.get(query.get("v", [""])[0])
+            return (body.encode() if body else None), "text/csv"
+        if "/aqf_p_01" in path:
+            after = None
+            for f in query.get("filters", []):
+                field, op, value = f.split(",", 2)
+                if field == "publishtime" and op == "GT":
+                    after = value
+            return aqi_csv(after), "text/csv"
+        if path.lower().endswith((".png", ".gif")):
+            with self._lock:
+                roll_error, roll_slow = self._random.random(), self._random.random()
+            if roll_error < self.error_rate:
+                return 503, None
+            if roll_slow < self.straggler_rate:
+                threading.Event().wait(self.straggler_delay)
+            with self._lock:
+                if path not in self._panels:
+                    self._panels[path] = sample_panel(path)
+                body = self._panels[path]
+            return body, "image/gif" if path.lower().endswith(".gif") else "image/png"
+        return None, None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInAdapter(requests.adapters.HTTPAdapter):
+    """將 HOSTS 的 https 請求改寫為 <base_url>/<主機>/<路徑> 後送出"""
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = f"{self.base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        return super().send(request, **kwargs)
+
+
+def mount_standin(session, base_url, pool_size=16):
+    """讓 session 對 HOSTS 的請求改送到本機替身"""
+    adapter = StandInAdapter(base_url, pool_connections=1, pool_maxsize=pool_size)
+    for host in HOSTS:
+        session.mount(f"https://{host}/", adapter)
+    return session
@@ -0,0 +1,4 @@
+"""
+seanforecast 共用模組
+供 7daysforecast.py、2daysdorecast.py、AQI_forecast.py 共用的下載、快取等功能
+"""
@@ -0,0 +1,7 @@
+import sys
+
+from seanforecast.runner import main
+
+# 保護進入點：以 spawn 啟動的子行程 (AQI 多行程繪圖) 會重新載入此模組
+if __name__ == "__main__":
+    sys.exit(main())
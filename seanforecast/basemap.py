@@ -0,0 +1,92 @@
+"""
+底圖快取：各底圖 PNG (4570x2571) 只解碼一次，轉為 RGBA 後以原始陣列 (.npy) 存於 CACHE_DIR/basemaps
+- 以來源檔內容的 SHA-256 為鍵，底圖更新後自動重建 (同名的舊快取一併刪除)
+- 之後的執行以記憶體映射 (copy-on-write) 建立畫布：不需解壓 PNG，未被覆寫的頁面與其他行程共用
+"""
+
+import os
+import glob
+
+import numpy as np
+from PIL import Image
+
+from seanforecast.cache import CACHE_DIR
+from seanforecast.manifest import file_digest
+from seanforecast.stages import stage, annotate
+
+# ==========================================
+# ⚙️ 設定區
+# ==========================================
+BASE_MAP_CACHE_DIR = os.path.join(CACHE_DIR, "basemaps")
+
+# BASE_MAP_CACHE=0 時每次直接解碼 PNG
+BASE_MAP_CACHE = os.environ.get("BASE_MAP_CACHE", "1") != "0"
+
+
+def _cache_path(path, digest):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(BASE_MAP_CACHE_DIR, f"{name}.{digest[:16]}.npy")
+
+
+def _decode(path):
+    return Image.open(path).convert("RGBA")
+
+
+def _store(path, digest, img):
+    """寫入 .npy (先寫暫存檔再取代)，並刪除同一底圖的舊快取"""
+    cache_path = _cache_path(path, digest)
+    os.makedirs(BASE_MAP_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(img))
+    os.replace(tmp_path, cache_path)
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for old in glob.glob(os.path.join(BASE_MAP_CACHE_DIR, f"{glob.escape(stem)}.*.npy")):
+        if old != cache_path:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+def _map(cache_path):
+    """以私有映射 (寫入時才複製該頁) 開啟快取，回傳可直接繪製的 RGBA 畫布"""
+    data = np.load(cache_path, mmap_mode="c")
+    if data.ndim != 3 or data.shape[2] != 4 or data.dtype != np.uint8:
+        raise ValueError(f"底圖快取格式不符: {cache_path}")
+    h, w = data.shape[:2]
+    canvas = Image.frombuffer("RGBA", (w, h), data, "raw", "RGBA", 0, 1)
+    # 映射本身即為私有副本，寫入不會影響快取檔，不需 Pillow 再複製整張圖
+    canvas.readonly = 0
+    return canvas
+
+
+def load_base_map(path):
+    """
+    回傳底圖的 RGBA 畫布 (等同 Image.open(path).convert("RGBA"))
+    每次呼叫都是獨立的畫布，可直接在上面合成
+    """
+    with stage("base_map"):
+        digest = file_digest(path) if BASE_MAP_CACHE else None
+        if digest is None:
+            return _decode(path)
+
+        cache_path = _cache_path(path, digest)
+        try:
+            canvas = _map(cache_path)
+            annotate(cache="hit")
+            return canvas
+        except (OSError, ValueError):
+            pass
+
+        annotate(cache="miss")
+        img = _decode(path)
+        # 含 ICC 設定檔的底圖不快取 (原始陣列無法保存，輸出時會用到)
+        if "icc_profile" in img.info:
+            return img
+        try:
+            _store(path, digest, img)
+        except OSError as e:
+            print(f"底圖快取寫入失敗: {e}")
+        return img
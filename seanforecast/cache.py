@@ -0,0 +1,249 @@
+"""
+磁碟與執行期間快取
+快取檔案統一放在 CACHE_DIR (預設 ./.cache，可用環境變數 SEANFORECAST_CACHE_DIR 覆寫)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+from seanforecast.stages import annotate
+
+# ==========================================
+# ⚙️ 設定區
+# ==========================================
+CACHE_DIR = os.environ.get("SEANFORECAST_CACHE_DIR", "./.cache")
+
+# 初始時間快取有效秒數 (同一模式週期內重複執行時略過查詢)
+INIT_TIME_TTL = int(os.environ.get("INIT_TIME_TTL", "1800"))
+INIT_TIME_CACHE_FILE = os.path.join(CACHE_DIR, "init_times.json")
+
+# 影像快取：總容量上限 (位元組，0 表示停用) 與免驗證的有效秒數
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, "images")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(300 * 1024 * 1024)))
+IMAGE_CACHE_MAX_AGE = int(os.environ.get("IMAGE_CACHE_MAX_AGE", "3600"))
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    """先寫暫存檔再取代，避免中斷時留下壞掉的快取"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+# ==========================================
+# 🕒 初始時間快取
+# ==========================================
+class InitTimeResolver:
+    """
+    依 csv_url 查詢模式初始時間
+    - 同一次執行中相同 csv_url 只查詢一次 (gfs_fnv3 與 gsm_ai 共用、Day 1/Day 2 共用)
+    - 成功的結果寫入磁碟，TTL 內的重複執行直接沿用
+    """
+
+    def __init__(self, fetch, cache_path=INIT_TIME_CACHE_FILE, ttl=INIT_TIME_TTL):
+        self.fetch = fetch
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self._values = {}
+        self._lock = threading.Lock()
+        self._url_locks = {}
+
+    def _url_lock(self, csv_url):
+        with self._lock:
+            return self._url_locks.setdefault(csv_url, threading.Lock())
+
+    def __call__(self, csv_url):
+        # 同一 URL 同時只允許一個查詢，其餘等待結果
+        with self._url_lock(csv_url):
+            if csv_url in self._values:
+                return self._values[csv_url]
+
+            value = self._load(csv_url)
+            if value is None:
+                value = self.fetch(csv_url)
+                if value:
+                    self._store(csv_url, value)
+
+            # 失敗 (None) 也記住，避免同一次執行重複等待逾時
+            self._values[csv_url] = value
+            return value
+
+    def _load(self, csv_url):
+        if self.ttl <= 0:
+            return None
+        entry = _read_json(self.cache_path).get(csv_url)
+        if entry and time.time() - entry.get("fetched_at", 0) < self.ttl:
+            return entry.get("value")
+        return None
+
+    def _store(self, csv_url, value):
+        with self._lock:
+            data = _read_json(self.cache_path)
+            data[csv_url] = {"value": value, "fetched_at": time.time()}
+            try:
+                _write_json(self.cache_path, data)
+            except OSError as e:
+                print(f"初始時間快取寫入失敗: {e}")
+
+
+# ==========================================
+# 🖼 影像快取
+# ==========================================
+class ImageCache:
+    """
+    以完整 URL (含初始時間) 為索引、以內容雜湊存放的影像快取
+    - 有效期間內直接回傳快取內容，不發出任何請求
+    - 過期後以 ETag / Last-Modified 發出條件式請求，304 時沿用快取
+    - 總容量超過上限時，依最近使用時間 (LRU) 淘汰
+    """
+
+    def __init__(self, root=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, max_age=IMAGE_CACHE_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = os.path.join(root, "index.json")
+        self._index = None
+        self._lock = threading.Lock()
+        self._url_locks = {}
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _entries(self):
+        if self._index is None:
+            self._index = _read_json(self.index_path)
+        return self._index
+
+    def _read_blob(self, entry):
+        try:
+            with open(self._blob_path(entry["blob"]), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def fetch(self, url, session, timeout=15, get=None):
+        """
+        回傳 URL 的內容 (bytes)，失敗時拋出例外
+        get(url, headers=..., timeout=...) 可替換實際送出請求的方式 (預設為 session.get)
+        """
+        if get is None:
+            get = lambda u, headers, timeout: session.get(u, headers=headers, verify=False, timeout=timeout)
+        if not self.enabled:
+            r = get(url, headers={}, timeout=timeout)
+            r.raise_for_status()
+            annotate(cache="disabled", bytes_transferred=len(r.content))
+            return r.content
+
+        # 多個產品同時要求同一 URL 時只下載一次，其餘等待後讀取快取
+        with self._url_lock(url):
+            return self._fetch(url, get, timeout)
+
+    def _fetch(self, url, get, timeout):
+        with self._lock:
+            entry = self._entries().get(url)
+            content = self._read_blob(entry) if entry else None
+            if content is None:
+                entry = None
+
+        now = time.time()
+        if entry and now - entry["validated_at"] < self.max_age:
+            with self._lock:
+                entry["last_used"] = now
+                self._save()
+            annotate(cache="hit", bytes_transferred=0)
+            return content
+
+        # 條件式請求 (快取過期或不存在)
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        r = get(url, headers=headers, timeout=timeout)
+        if entry and r.status_code == 304:
+            with self._lock:
+                entry["validated_at"] = entry["last_used"] = now
+                self._save()
+            annotate(cache="revalidated", bytes_transferred=0)
+            return content
+
+        r.raise_for_status()
+        self._store(url, r)
+        annotate(cache="miss", bytes_transferred=len(r.content))
+        return r.content
+
+    def _store(self, url, response):
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        now = time.time()
+        with self._lock:
+            try:
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(content)
+                    os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"影像快取寫入失敗: {e}")
+                return
+
+            self._entries()[url] = {
+                "blob": digest,
+                "size": len(content),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "validated_at": now,
+                "last_used": now,
+            }
+            self._evict()
+            self._save()
+
+    def _evict(self):
+        """依 LRU 淘汰，直到總容量 (以不重複的內容計) 低於上限"""
+        entries = self._entries()
+        blob_sizes = {e["blob"]: e["size"] for e in entries.values()}
+        total = sum(blob_sizes.values())
+        for url in sorted(entries, key=lambda u: entries[u]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            digest = entries.pop(url)["blob"]
+            if all(e["blob"] != digest for e in entries.values()):
+                total -= blob_sizes[digest]
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+
+    def _save(self):
+        try:
+            _write_json(self.index_path, self._entries())
+        except OSError as e:
+            print(f"影像快取索引寫入失敗: {e}")
+
+
+# 所有腳本共用的影像快取
+image_cache = ImageCache()
@@ -0,0 +1,192 @@
+"""
+共用合成功能：將單一面板縮放、遮罩後合成至底圖
+所有中繼圖層只建立在面板範圍內，記憶體與運算量與面板大小成正比，而非整張底圖
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageChops, ImageDraw
+
+from seanforecast.cache import CACHE_DIR
+from seanforecast.stages import stage, timed, annotate
+
+# 編譯後的遮罩存放位置；遮罩產生方式改變時請遞增 MASK_VERSION
+MASK_CACHE_DIR = os.path.join(CACHE_DIR, "masks")
+MASK_VERSION = 1
+
+# 預設去白底閥值 (R、G、B 皆大於此值視為白色)
+WHITE_THRESHOLD = 220
+
+# 面板縮放方式：名稱 → (PIL 濾波器, reducing_gap)
+# 預設為原本的 LANCZOS；可用環境變數 PANEL_RESAMPLE 或各模式/各天設定的 'resample' 覆寫
+# (速度與畫質差異見 benchmarks/bench_resample.py)
+#   reduce_bicubic → 縮小 2×reducing_gap 倍以上時先以 reduce() 整數倍縮小，其餘再以 BICUBIC 縮放
+RESAMPLE_POLICIES = {
+    "lanczos": (Image.Resampling.LANCZOS, None),
+    "bicubic": (Image.Resampling.BICUBIC, None),
+    "bilinear": (Image.Resampling.BILINEAR, None),
+    "reduce_bicubic": (Image.Resampling.BICUBIC, 2.0),
+}
+DEFAULT_RESAMPLE = os.environ.get("PANEL_RESAMPLE", "lanczos")
+
+# 編譯後的面板：整數座標 (x, y, w, h)、面板大小的 "L" 遮罩 (0=透明, 255=保留)、設定雜湊、
+# 遮罩非零範圍在畫布上的座標 (x0, y0, x1, y1)，遮罩全為 0 時為 None
+CompiledPanel = namedtuple("CompiledPanel", ["x", "y", "w", "h", "mask", "key", "box"])
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def palette_entries_rgba(img):
+    """調色盤影像 ("P") 各索引展開後的 RGBA (256, 4)，與 img.convert("RGBA") 的結果一致 (含 transparency)"""
+    probe = Image.frombytes("P", (256, 1), bytes(range(256)))
+    mode = img.palette.mode
+    probe.putpalette(img.getpalette(rawmode=mode), mode)
+    probe.info = dict(img.info)
+    return np.array(probe.convert("RGBA"))[0]
+
+
+@timed("keying")
+def make_white_transparent(img, threshold=WHITE_THRESHOLD):
+    """
+    將白色背景轉為透明
+    - 調色盤影像 (GIF 等)：只判斷 256 個調色盤色彩，把透明度寫入 RGBA 調色盤，影像維持 "P" 模式
+      (每像素 1 byte)，直到縮放前才展開 (composite_panel)，結果與展開後逐像素處理相同
+    - 其他影像：只複製一次像素資料，在同一塊 RGBA 緩衝區上以 min(R,G,B) 一次比較後原地改寫 Alpha，
+      再以 frombuffer 直接包裝回 Image (不再複製)
+    """
+    if img.mode == "P":
+        entries = palette_entries_rgba(img)
+        entries[:, 3] *= entries[:, :3].min(axis=1) <= threshold
+        keyed = img.copy()
+        keyed.info.pop("transparency", None)
+        keyed.putpalette(entries.tobytes(), "RGBA")
+        return keyed
+
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    data = np.array(img)
+
+    # min(R,G,B) > threshold 等同 R、G、B 皆大於閥值
+    rgb_min = np.minimum(data[..., 0], data[..., 1])
+    np.minimum(rgb_min, data[..., 2], out=rgb_min)
+    data[..., 3] *= rgb_min <= threshold
+
+    return Image.frombuffer("RGBA", img.size, data, "raw", "RGBA", 0, 1)
+
+
+def round_box(cfg):
+    """將 {'x','y','w','h'} 設定四捨五入為整數 (x, y, w, h)"""
+    return (
+        int(round(cfg['x'])), int(round(cfg['y'])),
+        int(round(cfg['w'])), int(round(cfg['h']))
+    )
+
+
+def layout_key(layout, masks, keep_box=None):
+    """面板設定的雜湊 (相同版面的天數/模式共用同一份遮罩)"""
+    payload = json.dumps(
+        {'v': MASK_VERSION, 'layout': layout, 'masks': masks, 'keep_box': keep_box},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+@timed("mask_draw")
+def _rasterize_mask(px, py, pw, ph, masks, keep_box):
+    """在面板座標上畫出遮罩 (矩形座標由底圖座標平移)"""
+    mask = Image.new("L", (pw, ph), 255)
+    draw = ImageDraw.Draw(mask)
+
+    def clear(x0, y0, x1, y1):
+        draw.rectangle([x0 - px, y0 - py, x1 - px, y1 - py], fill=0)
+
+    if keep_box:
+        # 保留區塊外的四周全部透明 (面板以外的部分本來就不會合成，因此只需涵蓋面板範圍)
+        kx, ky, kw, kh = round_box(keep_box)
+        right, bottom = px + pw, py + ph
+        clear(px, py, right, ky)                  # 上方區域
+        clear(px, ky + kh, right, bottom)         # 下方區域
+        clear(px, ky, kx, ky + kh)                # 左側區域
+        clear(kx + kw, ky, right, ky + kh)        # 右側區域
+
+    for m in masks:
+        mx, my, mw, mh = round_box(m)
+        clear(mx, my, mx + mw, my + mh)
+    return mask
+
+
+def compile_panel(layout, masks, keep_box=None):
+    """將面板設定編譯為整數座標與遮罩 (記憶體快取 + 磁碟快取)"""
+    key = layout_key(layout, masks, keep_box)
+    with _compiled_lock:
+        panel = _compiled.get(key)
+        if panel:
+            return panel
+
+        px, py, pw, ph = round_box(layout)
+        mask_path = os.path.join(MASK_CACHE_DIR, f"{key}.npy")
+        mask = None
+        try:
+            data = np.load(mask_path)
+            if data.shape == (ph, pw):
+                mask = Image.fromarray(data, "L")
+        except (OSError, ValueError):
+            pass
+
+        if mask is None:
+            mask = _rasterize_mask(px, py, pw, ph, masks, keep_box)
+            try:
+                os.makedirs(MASK_CACHE_DIR, exist_ok=True)
+                tmp_path = f"{mask_path}.{os.getpid()}.tmp.npy"
+                np.save(tmp_path, np.asarray(mask))
+                os.replace(tmp_path, mask_path)
+            except OSError as e:
+                print(f"遮罩快取寫入失敗: {e}")
+
+        bbox = mask.getbbox()
+        box = (px + bbox[0], py + bbox[1], px + bbox[2], py + bbox[3]) if bbox else None
+        panel = CompiledPanel(px, py, pw, ph, mask, key, box)
+        _compiled[key] = panel
+        return panel
+
+
+def resize_panel(img, size, policy=None):
+    """依縮放方式 (RESAMPLE_POLICIES 的名稱，None 為 DEFAULT_RESAMPLE) 將影像縮放為 size"""
+    policy = policy or DEFAULT_RESAMPLE
+    if policy not in RESAMPLE_POLICIES:
+        raise ValueError(f"未知的縮放方式 {policy!r}，可用：{', '.join(RESAMPLE_POLICIES)}")
+    resample, reducing_gap = RESAMPLE_POLICIES[policy]
+    # 調色盤影像在此才展開為 RGBA (調色盤影像的 resize 只支援最近鄰)
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    return img.resize(size, resample, reducing_gap=reducing_gap)
+
+
+def composite_panel(canvas, img, panel, resample=None):
+    """將 (已去白底的) 影像縮放至面板大小，套用編譯好的遮罩後合成至畫布；resample 為縮放方式 (見 RESAMPLE_POLICIES)"""
+    # 1. 縮放並貼到面板大小的透明圖層 (使用自身作為遮罩保留透明度)
+    with stage("resize"):
+        annotate(resample=resample or DEFAULT_RESAMPLE)
+        img_resized = resize_panel(img, (panel.w, panel.h), resample)
+        layer = Image.new("RGBA", (panel.w, panel.h), (0, 0, 0, 0))
+        layer.paste(img_resized, (0, 0), img_resized)
+
+    # 2. Alpha 與遮罩相乘 (遮罩只有 0/255，結果與逐一畫透明方塊相同)
+    with stage("masking"):
+        layer.putalpha(ImageChops.multiply(layer.getchannel("A"), panel.mask))
+
+    # 3. 只在遮罩非零的範圍內合成 (alpha_composite 會寫回整個目的範圍，
+    #    不可碰到相鄰面板的區域，例如 2 天預報 gfs_fnv3 的版面與 ecmwf_wrf 重疊，但只保留 keep_box)
+    if panel.box is None:
+        return
+    with stage("composite"):
+        x0, y0, x1, y1 = panel.box
+        canvas.alpha_composite(
+            layer, dest=(x0, y0), source=(x0 - panel.x, y0 - panel.y, x1 - panel.x, y1 - panel.y)
+        )
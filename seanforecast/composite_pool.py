@@ -0,0 +1,150 @@
+"""
+以多個行程平行合成面板
+畫布放在父行程配置的共享記憶體中 (multiprocessing.shared_memory)：
+- 父行程只傳送下載到的原始影像內容 (數百 KB) 與面板設定，不傳送解碼後的像素
+- worker 解碼、去白底、縮放、遮罩後直接寫入畫布上該面板遮罩的非零範圍 (CompiledPanel.box)
+- 範圍互不重疊的面板同時合成；範圍重疊的面板 (版面設定重疊時) 依送出順序一個接一個合成，
+  結果與在原行程內依序合成完全相同
+- 全部完成後由父行程編碼輸出
+
+COMPOSITE_PROCESSES=0 (預設) 時不使用本模組，仍在原行程內依序合成
+"""
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+from seanforecast.basemap import load_base_map
+from seanforecast.compose import compile_panel
+
+# 合成用的行程數 (0 表示不使用行程池)
+COMPOSITE_PROCESSES = int(os.environ.get("COMPOSITE_PROCESSES", "0"))
+
+
+def _canvas_view(buf, size):
+    """以共享記憶體為像素的 RGBA 畫布 (直接寫入，不複製)"""
+    canvas = Image.frombuffer("RGBA", size, buf, "raw", "RGBA", 0, 1)
+    canvas.readonly = 0
+    return canvas
+
+
+def _composite_job(shm_name, size, content, config, threshold):
+    """在 worker 中處理一個面板並合成到共享畫布；影像無法解碼時回傳 False"""
+    from seanforecast.compose import composite_panel, make_white_transparent
+    from seanforecast.fetch import decode_image
+
+    img = decode_image(content)
+    if img is None:
+        return False
+    img = make_white_transparent(img, threshold)
+    panel = compile_panel(config['layout'], config['masks'], keep_box=config.get('keep_box'))
+
+    # 共享記憶體由父行程建立與釋放 (spawn 的子行程與父行程共用 resource_tracker)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        canvas = _canvas_view(shm.buf, size)
+        composite_panel(canvas, img, panel, config.get('resample'))
+        # 畫布仍參照共享記憶體時無法關閉
+        del canvas
+    finally:
+        shm.close()
+    return True
+
+
+def _overlaps(a, b):
+    """兩個 (x0, y0, x1, y1) 範圍是否重疊"""
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _forward(source, target):
+    """將 source 的結果 (或例外) 轉交給 target"""
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class SharedCanvas:
+    """放在共享記憶體中的畫布 (內容由底圖複製而來)"""
+
+    def __init__(self, base_map_path):
+        base = load_base_map(base_map_path)
+        self.size = base.size
+        w, h = self.size
+        self.shm = shared_memory.SharedMemory(create=True, size=w * h * 4)
+        np.ndarray((h, w, 4), np.uint8, self.shm.buf)[:] = np.asarray(base)
+        # 已送出的 (寫入範圍, Future)，用來找出範圍重疊、需等待的面板
+        self.jobs = []
+
+    def image(self):
+        """以共享記憶體為像素的 Image (不複製)；使用完畢需先釋放才能 close()"""
+        return _canvas_view(self.shm.buf, self.size)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class CompositePool:
+    """
+    合成行程池：submit() 回傳 Future (結果為是否成功)
+    同一畫布上寫入範圍不重疊的面板同時合成，重疊的等先送出的完成後才開始；
+    取畫布內容前需等待該畫布的所有 Future
+    """
+
+    def __init__(self, processes=COMPOSITE_PROCESSES):
+        # spawn：不複製父行程的執行緒與鎖 (下載執行緒、多產品執行器中的其他產品)
+        self._pool = ProcessPoolExecutor(
+            max_workers=max(processes, 1), mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, canvas, content, config, threshold):
+        """content 為原始影像內容，config 含 'layout'、'masks' 與選用的 'keep_box'、'resample'"""
+        # 只傳送合成需要的設定 (腳本中的設定可能含有無法 pickle 的函式)
+        config = {key: config.get(key) for key in ('layout', 'masks', 'keep_box', 'resample')}
+        box = compile_panel(config['layout'], config['masks'], keep_box=config.get('keep_box')).box
+        waits = [f for b, f in canvas.jobs if box and b and _overlaps(b, box)]
+        result = self._after(waits, _composite_job, canvas.shm.name, canvas.size, content, config, threshold)
+        canvas.jobs.append((box, result))
+        return result
+
+    def _after(self, waits, fn, *args):
+        """waits 中的 Future 全部完成後才送出 fn，回傳代表其結果的 Future"""
+        result = Future()
+        remaining = [len(waits)]
+        lock = threading.Lock()
+
+        def launch():
+            try:
+                inner = self._pool.submit(fn, *args)
+            except Exception as e:
+                result.set_exception(e)
+                return
+            inner.add_done_callback(lambda f: _forward(f, result))
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                launch()
+
+        if not waits:
+            launch()
+        for f in waits:
+            f.add_done_callback(on_done)
+        return result
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
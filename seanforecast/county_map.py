@@ -0,0 +1,264 @@
+"""
+縣市幾何預處理與面量圖的點陣化索引
+- 縣市幾何：SHP 只讀取一次，轉為 EPSG:4326、依輸出像素解析度簡化後以 WKB 存入快取
+將縣市多邊形只點陣化一次，得到「縣市編號索引圖」與「邊界疊加層」並快取；
+每日的面量圖只需以 NumPy 依縣市編號查表上色，不必再經過 geopandas / matplotlib
+
+matplotlib 繪圖的版面設定 (畫布尺寸、經緯度範圍、去白邊) 也集中在此，
+確保索引圖與直接繪圖的位置完全一致
+"""
+
+import os
+import hashlib
+import threading
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from seanforecast.cache import CACHE_DIR
+from seanforecast.fonts import setup_matplotlib
+from seanforecast.stages import timed
+
+# 幾何與索引圖快取位置；預處理或點陣化方式改變時請遞增對應的版本
+COUNTY_MAP_CACHE_DIR = os.path.join(CACHE_DIR, "county_map")
+GEOMETRY_VERSION = 1
+INDEX_VERSION = 2
+
+# 繪圖版面：畫布尺寸 (英吋)、解析度、經緯度範圍 (lon_min, lon_max, lat_min, lat_max)
+MapStyle = namedtuple("MapStyle", ["figsize", "dpi", "extent"])
+
+_loaded = {}
+_loaded_lock = threading.RLock()
+_hashes = {}
+
+
+# ==========================================
+# 🗺 matplotlib 繪圖版面
+# ==========================================
+def new_map_axes(style, size):
+    """
+    建立剛好 size (寬, 高) 像素、滿版無邊框的透明畫布，回傳 (plt, fig, ax)
+    解析度依高度換算 (style.figsize 高度對應 size 高度)，線條粗細與原本縮放後一致
+    """
+    plt = setup_matplotlib()
+    dpi = size[1] / style.figsize[1]
+    fig = plt.figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    fig.patch.set_alpha(0)
+    # 使用 add_axes 強制讓地圖填滿整個畫布，去除所有白邊與 padding
+    ax = fig.add_axes([0, 0, 1, 1], projection=None)
+    return plt, fig, ax
+
+
+def finish_map_axes(ax, style):
+    """鎖定經緯度範圍 (確保每次縮放比例一致)，讓範圍撐滿畫布並關閉坐標軸"""
+    lon_min, lon_max, lat_min, lat_max = style.extent
+    ax.set_xlim(lon_min, lon_max)
+    ax.set_ylim(lat_min, lat_max)
+    ax.set_aspect("auto")
+    ax.set_axis_off()
+
+
+def render_map(plt, fig):
+    """直接將畫布繪製到記憶體中的 RGBA 緩衝區 (不經過 PNG 編碼/解碼/縮放)"""
+    fig.canvas.draw()
+    data = np.array(fig.canvas.buffer_rgba())
+    plt.close(fig)
+    return Image.frombuffer("RGBA", (data.shape[1], data.shape[0]), data, "raw", "RGBA", 0, 1)
+
+
+@timed("draw_map")
+def draw_choropleth(gdf, colors, size, style):
+    """
+    以 matplotlib 繪製滿版、無邊框、透明背景的面量圖，回傳 size 大小的 RGBA Image
+    colors 為與 gdf 同索引的 "#rrggbb" 色碼 Series
+    """
+    plt, fig, ax = new_map_axes(style, size)
+
+    # 畫底圖
+    for color, rows in colors.groupby(colors).groups.items():
+        gdf.loc[rows].plot(ax=ax, color=color, edgecolor="black", linewidth=0.5)
+
+    # 縣市邊界再疊一層
+    gdf.boundary.plot(ax=ax, color="#555555", linewidth=1)
+
+    # 設定經緯度範圍並關閉坐標軸
+    finish_map_axes(ax, style)
+
+    # 繪製至記憶體 (不產生暫存檔)
+    return render_map(plt, fig)
+
+
+# ==========================================
+# 🧮 縣市編號索引圖
+# ==========================================
+class CountyIndexMap:
+    """縣市編號索引圖 (0 = 縣市以外，i = names[i-1]) 與邊界疊加層"""
+
+    def __init__(self, names, index, overlay):
+        self.names = list(names)
+        self.index = index
+        self.overlay = overlay
+
+    @property
+    def size(self):
+        return self.overlay.size
+
+    def render(self, codes, palette):
+        """
+        依各縣市 (names 順序) 的色彩索引查表上色並疊上邊界，回傳 RGBA Image
+        palette 為 palette_rgba() 的結果；索引 -1 對應 palette 最後一色 (無資料)
+        """
+        lut = np.zeros((len(self.names) + 1, 4), np.uint8)
+        lut[1:] = palette[np.asarray(codes)]
+
+        fill = Image.fromarray(lut[self.index], "RGBA")
+        return Image.alpha_composite(fill, self.overlay)
+
+
+def palette_rgba(colors):
+    """將 "#rrggbb" 色碼列表轉為 (N, 4) 的 RGBA 查表陣列"""
+    return np.array(
+        [(int(c[1:3], 16), int(c[3:5], 16), int(c[5:7], 16), 255) for c in colors], np.uint8
+    )
+
+
+def build_county_index_map(gdf, name_col, size, style):
+    """以 matplotlib 點陣化一次縣市多邊形，建立 CountyIndexMap (size 為目標像素尺寸)"""
+    names = list(gdf[name_col])
+    if len(names) >= 255:
+        raise ValueError(f"縣市數量過多 ({len(names)})，索引圖僅支援 254 個")
+
+    # 1. 編號圖：每個縣市以 #0000ii 填色，關閉反鋸齒確保顏色不被混合
+    plt, fig, ax = new_map_axes(style, size)
+    gdf.plot(
+        ax=ax, color=[f"#{i:06x}" for i in range(1, len(names) + 1)],
+        edgecolor="none", linewidth=0, antialiased=False
+    )
+    finish_map_axes(ax, style)
+    ids = np.asarray(render_map(plt, fig))
+    index = np.where(ids[..., 3] > 0, ids[..., 2], 0).astype(np.uint8)
+
+    # 2. 邊界疊加層：與原本繪圖相同的線條 (黑色 0.5 + 灰色 1)
+    plt, fig, ax = new_map_axes(style, size)
+    gdf.plot(ax=ax, facecolor="none", edgecolor="black", linewidth=0.5)
+    gdf.boundary.plot(ax=ax, color="#555555", linewidth=1)
+    finish_map_axes(ax, style)
+    overlay = render_map(plt, fig)
+
+    return CountyIndexMap(names, index, overlay)
+
+
+def source_hash(shp_path):
+    """SHP 及其附屬檔案 (.dbf/.shx/.prj/.cpg) 的內容雜湊 (同一行程內依大小/修改時間沿用)"""
+    stem = os.path.splitext(shp_path)[0]
+    paths = [stem + ext for ext in (".shp", ".dbf", ".shx", ".prj", ".cpg", ".CPG") if os.path.exists(stem + ext)]
+    stamp = tuple((p, os.path.getsize(p), os.path.getmtime(p)) for p in paths)
+    if stamp in _hashes:
+        return _hashes[stamp]
+
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.splitext(path)[1].lower().encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    _hashes[stamp] = h.hexdigest()
+    return _hashes[stamp]
+
+
+def _atomic_savez(path, **arrays):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"縣市快取寫入失敗 ({path}): {e}")
+
+
+# ==========================================
+# 📐 縣市幾何預處理
+# ==========================================
+def simplify_tolerance(size, style):
+    """輸出半個像素對應的經緯度 (小於此值的細節在圖上看不出來)"""
+    lon_min, lon_max, lat_min, lat_max = style.extent
+    return 0.5 * min((lon_max - lon_min) / size[0], (lat_max - lat_min) / size[1])
+
+
+def preprocess_counties(shp_path, name_col, tolerance):
+    """讀取 SHP、轉為 EPSG:4326 並簡化，回傳 (縣市名稱, WKB 列表)"""
+    import geopandas as gpd
+    import shapely
+
+    print("正在預處理 SHP 檔案 (僅在 SHP 變更時執行)...")
+    gdf = gpd.read_file(shp_path, encoding="utf-8")
+    if gdf.crs is None or gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    geoms = shapely.simplify(gdf.geometry.values, tolerance, preserve_topology=True)
+    return list(gdf[name_col]), shapely.to_wkb(geoms)
+
+
+def load_county_geometry(shp_path, name_col, size, style):
+    """
+    取得縣市幾何 GeoDataFrame (欄位: name_col、geometry；EPSG:4326、已簡化)
+    順序即為縣市編號 (第 i 列 = 編號 i+1)，SHP/DBF 內容改變時自動重建
+    """
+    tolerance = simplify_tolerance(size, style)
+    key_src = f"geom|{GEOMETRY_VERSION}|{source_hash(shp_path)}|{name_col}|{tolerance:.8g}"
+    key = hashlib.sha256(key_src.encode("utf-8")).hexdigest()[:16]
+
+    with _loaded_lock:
+        if key in _loaded:
+            return _loaded[key]
+
+    import geopandas as gpd
+    import shapely
+
+    cache_path = os.path.join(COUNTY_MAP_CACHE_DIR, f"geom_{key}.npz")
+    try:
+        with np.load(cache_path) as data:
+            names = data["names"].tolist()
+            blob, offsets = data["wkb"].tobytes(), data["offsets"]
+            wkbs = [blob[offsets[i]:offsets[i + 1]] for i in range(len(names))]
+    except (OSError, ValueError, KeyError):
+        names, wkbs = preprocess_counties(shp_path, name_col, tolerance)
+        offsets = np.cumsum([0] + [len(w) for w in wkbs])
+        _atomic_savez(
+            cache_path, names=np.array(names),
+            wkb=np.frombuffer(b"".join(wkbs), np.uint8), offsets=offsets
+        )
+
+    gdf = gpd.GeoDataFrame({name_col: names}, geometry=shapely.from_wkb(wkbs), crs="EPSG:4326")
+    with _loaded_lock:
+        _loaded[key] = gdf
+    return gdf
+
+
+def load_county_index_map(shp_path, name_col, size, style):
+    """取得 CountyIndexMap (記憶體快取 → 磁碟快取 → 由預處理過的縣市幾何重新點陣化)"""
+    key_src = f"{INDEX_VERSION}|{source_hash(shp_path)}|{name_col}|{size}|{tuple(style)}"
+    key = hashlib.sha256(key_src.encode("utf-8")).hexdigest()[:16]
+
+    with _loaded_lock:
+        if key in _loaded:
+            return _loaded[key]
+
+        cache_path = os.path.join(COUNTY_MAP_CACHE_DIR, f"{key}.npz")
+        try:
+            with np.load(cache_path) as data:
+                county_map = CountyIndexMap(
+                    data["names"].tolist(), data["index"], Image.fromarray(data["overlay"], "RGBA")
+                )
+        except (OSError, ValueError, KeyError):
+            print("正在建立縣市索引圖 (僅在 SHP 或版面變更時執行)...")
+            county_map = build_county_index_map(
+                load_county_geometry(shp_path, name_col, size, style), name_col, size, style
+            )
+            _atomic_savez(
+                cache_path, names=np.array(county_map.names), index=county_map.index,
+                overlay=np.asarray(county_map.overlay)
+            )
+
+        _loaded[key] = county_map
+        return county_map
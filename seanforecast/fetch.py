@@ -0,0 +1,81 @@
+"""
+共用下載功能：連線池 Session、初始時間查詢、影像下載 (經由影像快取)
+實際的請求經由 seanforecast/resilient.py (重試、每主機連線上限、影像的對沖請求)
+"""
+
+import io
+from functools import partial
+
+import requests
+import urllib3
+from PIL import Image
+
+from seanforecast.cache import image_cache
+from seanforecast.resilient import resilient_get
+from seanforecast.stages import stage, annotate
+
+# 關閉不安全的 SSL 憑證警告
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def create_session(pool_size=10):
+    """建立共用連線池的 Session，讓多個下載共用 TLS 連線"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = False
+    return session
+
+
+def get_init_time(csv_url, session=None):
+    """取得資料最新初始時間 (YYYYMMDDHHMM)"""
+    try:
+        with stage("init_time", url=csv_url):
+            r = resilient_get(session or requests, csv_url, timeout=10)
+            annotate(bytes=len(r.content), status=r.status_code)
+        r.raise_for_status()
+        content = r.text.strip()
+        # 內容格式通常為 "KEY_date,202602211200"
+        if ',' in content:
+            return content.split(',')[1].strip()
+        return None
+    except Exception as e:
+        print(f"取得初始時間失敗 ({csv_url}): {e}")
+        return None
+
+
+def fetch_image_bytes(url, session=None, cache=image_cache):
+    """下載影像的原始內容 (優先使用影像快取)；失敗時回傳 None"""
+    try:
+        with stage("download", url=url):
+            get = partial(resilient_get, session or requests, hedge=True)
+            content = cache.fetch(url, session or requests, timeout=15, get=get)
+            annotate(bytes=len(content))
+        return content
+    except Exception as e:
+        print(f" 下載失敗: {url}\n ({e})")
+        return None
+
+
+def decode_image(content, url=""):
+    """
+    將影像內容解碼為 PIL Image 物件；失敗時回傳 None
+    調色盤影像 (GIF 等) 維持 "P" 模式 (由 make_white_transparent 直接處理調色盤)，其他轉為 RGBA
+    """
+    try:
+        with stage("decode"):
+            img = Image.open(io.BytesIO(content))
+            if img.mode == "P":
+                img.load()
+                return img
+            return img.convert("RGBA")
+    except Exception as e:
+        print(f" 解碼失敗: {url}\n ({e})")
+        return None
+
+
+def download_image(url, session=None, cache=image_cache):
+    """下載 (fetch_image_bytes) 並解碼 (decode_image) 影像；失敗時回傳 None"""
+    content = fetch_image_bytes(url, session, cache)
+    return None if content is None else decode_image(content, url)
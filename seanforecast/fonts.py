@@ -0,0 +1,61 @@
+"""
+matplotlib 初始化：Agg 後端、持久化字型快取、預先決定的中文字型
+避免在 Linux runner 上尋找不存在的 "Microsoft JhengHei" 而重建字型快取
+"""
+
+import os
+
+from seanforecast.cache import CACHE_DIR
+
+# matplotlib 設定與字型快取目錄 (放在 CACHE_DIR 內，由 workflow 的 actions/cache 保存)
+MPL_CONFIG_DIR = os.path.join(CACHE_DIR, "matplotlib")
+
+# 中文字型候選路徑，依序使用第一個存在的檔案；可用環境變數 CJK_FONT_PATH 指定
+CJK_FONT_CANDIDATES = [
+    os.environ.get("CJK_FONT_PATH", ""),
+    "./fonts/NotoSansTC-Regular.otf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "C:/Windows/Fonts/msjh.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+]
+
+_configured = False
+
+
+def find_cjk_font():
+    """回傳第一個存在的中文字型路徑，找不到時回傳 None"""
+    for path in CJK_FONT_CANDIDATES:
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+def setup_matplotlib():
+    """初始化 matplotlib (只執行一次)，回傳 pyplot 模組"""
+    global _configured
+    if not _configured:
+        # 必須在 import matplotlib 之前設定
+        os.environ.setdefault("MPLCONFIGDIR", os.path.abspath(MPL_CONFIG_DIR))
+        os.makedirs(os.environ["MPLCONFIGDIR"], exist_ok=True)
+
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib import font_manager
+
+        families = ["sans-serif"]
+        font_path = find_cjk_font()
+        if font_path:
+            # 直接載入字型檔，不需要掃描系統字型
+            font_manager.fontManager.addfont(font_path)
+            families.insert(0, font_manager.FontProperties(fname=font_path).get_name())
+        else:
+            print("提示: 找不到中文字型，改用預設字型")
+
+        matplotlib.rcParams["font.family"] = families
+        matplotlib.rcParams["axes.unicode_minus"] = False
+        _configured = True
+
+    import matplotlib.pyplot as plt
+    return plt
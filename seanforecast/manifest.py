@@ -0,0 +1,96 @@
+"""
+執行紀錄 (run manifest)：記錄每個輸出檔是由哪些輸入產生的
+輸入包含各 csv_url 的模式初始時間、AQI publishtime、版面設定雜湊與底圖雜湊等；
+若與上次產生時完全相同且輸出檔仍存在，該輸出即可略過 (不下載、不繪圖)
+
+紀錄檔放在 outputs/manifest.json，與輸出圖一起提交；--force 可忽略紀錄強制重新產生
+"""
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+from seanforecast.cache import _read_json, _write_json
+from seanforecast import output
+
+MANIFEST_PATH = "./outputs/manifest.json"
+
+# 紀錄格式或輸入定義改變時請遞增 (所有輸出都會重新產生一次)
+MANIFEST_VERSION = 1
+
+_digests = {}
+
+
+def file_digest(path):
+    """檔案內容的 SHA-256 (同一行程內依大小/修改時間沿用)；檔案不存在時回傳 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if stamp not in _digests:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _digests[stamp] = h.hexdigest()
+    return _digests[stamp]
+
+
+def config_digest(config):
+    """設定 (dict/list，可含函式) 的穩定雜湊；函式以名稱表示"""
+    text = json.dumps(
+        config, sort_keys=True, ensure_ascii=False,
+        default=lambda o: getattr(o, "__qualname__", None) or repr(o)
+    )
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def encoding_inputs():
+    """輸出編碼設定也會影響輸出檔內容"""
+    return {
+        "profile": output.DEFAULT_PROFILE,
+        "extra_formats": output.DEFAULT_EXTRA_FORMATS,
+        "variants": {name: output.VARIANTS[name] for name in output.DEFAULT_VARIANTS},
+    }
+
+
+class RunManifest:
+    """outputs/manifest.json 的讀寫 (同一行程內多個產品同時寫入時以鎖保護)"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _key(self, output_path):
+        return os.path.relpath(os.path.abspath(output_path), os.path.dirname(os.path.abspath(self.path)))
+
+    def _load(self):
+        data = _read_json(self.path)
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("outputs", {})
+
+    def is_current(self, output_path, inputs, force=False):
+        """輸出檔存在且上次的輸入與 inputs 相同時回傳 True (force 時一律為 False)"""
+        if force or not os.path.exists(output_path):
+            return False
+        with self._lock:
+            entry = self._load().get(self._key(output_path))
+        return entry is not None and entry.get("inputs") == json.loads(json.dumps(inputs))
+
+    def record(self, output_path, inputs):
+        """記錄 output_path 已由 inputs 產生 (重新讀取紀錄檔再合併，不覆蓋其他產品的紀錄)"""
+        with self._lock:
+            outputs = self._load()
+            outputs[self._key(output_path)] = {
+                "inputs": inputs,
+                "built_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            _write_json(self.path, {"version": MANIFEST_VERSION, "outputs": dict(sorted(outputs.items()))})
+
+
+# 各產品共用的紀錄
+manifest = RunManifest()
@@ -0,0 +1,171 @@
+"""
+輸出圖檔編碼
+以具名的編碼設定 (profile) 儲存最終合成圖，並可額外輸出 WebP / JPEG 版本；
+同時由記憶體中的合成圖逐級 reduce() 產生縮小版 (1/2、1/4、縮圖)，列於輸出目錄的 variants.json
+每個檔案都會回報編碼時間與檔案大小
+
+環境變數：
+    OUTPUT_PROFILE        → 使用的編碼設定 (預設 "png"，與過去的輸出完全相同)
+    OUTPUT_EXTRA_FORMATS  → 以逗號分隔的額外格式，例如 "webp,jpeg"
+    OUTPUT_VARIANTS       → 以逗號分隔的縮小版 (預設 "half,quarter,thumb"，空字串表示不產生)
+"""
+
+import os
+import time
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from PIL import Image
+
+from seanforecast.cache import _read_json, _write_json
+from seanforecast.stages import stage, annotate
+
+# 編碼設定：
+#   drop_alpha → 整張圖完全不透明時轉為 RGB 儲存 (少 1/4 原始資料量，畫面不變)
+#   quantize   → 量化為 N 色調色盤 (有損，檔案最小)；None 表示不量化
+#   params     → 傳給 PIL Image.save 的參數
+EncodeProfile = namedtuple("EncodeProfile", ["drop_alpha", "quantize", "params"])
+
+PROFILES = {
+    # 原本的輸出方式：RGBA PNG、zlib 預設壓縮等級
+    "png": EncodeProfile(False, None, {}),
+    # 編碼最快：RGB、最低壓縮等級 (檔案較大)
+    "fast": EncodeProfile(True, None, {"compress_level": 1}),
+    # 無損縮小：RGB、最高壓縮等級並嘗試最佳 deflate 參數 (編碼最慢)
+    "compact": EncodeProfile(True, None, {"optimize": True}),
+    # 有損縮小：256 色調色盤 PNG (預報圖色彩有限，通常看不出差異)
+    "palette": EncodeProfile(True, 256, {"optimize": True}),
+}
+
+# 額外輸出格式：名稱 → (副檔名, PIL 格式, 參數)
+EXTRA_FORMATS = {
+    "webp": (".webp", "WEBP", {"quality": 85, "method": 4}),
+    "jpeg": (".jpg", "JPEG", {"quality": 90, "optimize": True}),
+}
+
+# 縮小版：名稱 → (檔名後綴, 相對原圖的縮小倍數)
+# 依倍數由小到大逐級產生，每一級由前一級 reduce() 而來 (倍數需為前一級的整數倍)
+VARIANTS = {
+    "half": ("_half", 2),
+    "quarter": ("_quarter", 4),
+    "thumb": ("_thumb", 8),
+}
+
+DEFAULT_PROFILE = os.environ.get("OUTPUT_PROFILE", "png")
+DEFAULT_EXTRA_FORMATS = [f for f in os.environ.get("OUTPUT_EXTRA_FORMATS", "").split(",") if f.strip()]
+DEFAULT_VARIANTS = [v.strip() for v in os.environ.get("OUTPUT_VARIANTS", "half,quarter,thumb").split(",") if v.strip()]
+
+# 各輸出圖與其縮小版的清單 (與輸出圖放在同一目錄)
+VARIANTS_INDEX_NAME = "variants.json"
+_index_lock = threading.Lock()
+
+# 單一檔案的編碼結果
+EncodeResult = namedtuple("EncodeResult", ["path", "profile", "seconds", "bytes"])
+
+
+def is_opaque(img):
+    """RGBA 影像的 Alpha 是否全為 255"""
+    return img.mode != "RGBA" or img.getchannel("A").getextrema() == (255, 255)
+
+
+def _timed_save(img, path, profile, fmt, params, extra_seconds=0.0):
+    """儲存並回傳 EncodeResult (extra_seconds：事先轉換色彩模式/量化所花的時間)"""
+    t0 = time.perf_counter()
+    with stage("encode", file=os.path.basename(path), profile=profile):
+        img.save(path, format=fmt, **params)
+        annotate(bytes=os.path.getsize(path))
+    seconds = time.perf_counter() - t0 + extra_seconds
+    result = EncodeResult(path, profile, seconds, os.path.getsize(path))
+    print(f"  編碼 {os.path.basename(path)} ({profile}): {seconds:.2f} s, {result.bytes / 1e6:.2f} MB")
+    return result
+
+
+def reduce_levels(img, variants):
+    """依倍數由小到大逐級 reduce()，回傳 [(名稱, 縮小後影像)]"""
+    levels, current, factor = [], img, 1
+    for name in sorted(variants, key=lambda v: VARIANTS[v][1]):
+        target = VARIANTS[name][1]
+        if target % factor:
+            raise ValueError(f"縮小版 {name!r} 的倍數 {target} 不是前一級 {factor} 的整數倍")
+        if target > factor:
+            current = current.reduce(target // factor)
+            factor = target
+        levels.append((name, current))
+    return levels
+
+
+def _update_index(path, levels):
+    """在輸出目錄的 variants.json 記錄 path 各級的尺寸與檔案 (其他輸出圖的紀錄保留)"""
+    index_path = os.path.join(os.path.dirname(os.path.abspath(path)), VARIANTS_INDEX_NAME)
+    entry = {
+        name: {
+            "width": size[0],
+            "height": size[1],
+            "files": {
+                os.path.splitext(r.path)[1][1:]: {"file": os.path.basename(r.path), "bytes": r.bytes}
+                for r in results
+            },
+        }
+        for name, size, results in levels
+    }
+    with _index_lock:
+        index = _read_json(index_path)
+        index[os.path.basename(path)] = {"updated": datetime.now().isoformat(timespec="seconds"), "levels": entry}
+        _write_json(index_path, dict(sorted(index.items())))
+
+
+def save_output(img, path, profile=None, extra_formats=None, variants=None):
+    """
+    依 profile 將 img 存為 PNG，並輸出 extra_formats 指定的額外格式 (與 path 同名、不同副檔名)；
+    variants 指定的縮小版以相同設定存為 <檔名><後綴>.png，並更新 variants.json
+    回傳 EncodeResult 列表
+    """
+    profile = profile or DEFAULT_PROFILE
+    extra_formats = DEFAULT_EXTRA_FORMATS if extra_formats is None else extra_formats
+    variants = DEFAULT_VARIANTS if variants is None else variants
+    if profile not in PROFILES:
+        raise ValueError(f"未知的輸出設定 {profile!r}，可用：{', '.join(PROFILES)}")
+    for name in extra_formats:
+        if name.strip().lower() not in EXTRA_FORMATS:
+            raise ValueError(f"未知的額外格式 {name!r}，可用：{', '.join(EXTRA_FORMATS)}")
+    for name in variants:
+        if name not in VARIANTS:
+            raise ValueError(f"未知的縮小版 {name!r}，可用：{', '.join(VARIANTS)}")
+
+    results = _save_level(img, path, profile, extra_formats)
+    if not variants:
+        return results
+
+    stem, ext = os.path.splitext(path)
+    levels = [("full", img.size, results)]
+    with stage("variants"):
+        reduced = reduce_levels(img, variants)
+    for name, small in reduced:
+        level_results = _save_level(small, stem + VARIANTS[name][0] + ext, profile, extra_formats)
+        levels.append((name, small.size, level_results))
+        results = results + level_results
+    _update_index(path, levels)
+    return results
+
+
+def _save_level(img, path, profile, extra_formats):
+    """單一尺寸：PNG + 額外格式"""
+    spec = PROFILES[profile]
+    t0 = time.perf_counter()
+    opaque = is_opaque(img)
+    png = img.convert("RGB") if spec.drop_alpha and opaque and img.mode == "RGBA" else img
+    if spec.quantize:
+        # 不透明圖用中位切割；含透明時 PIL 只支援 FASTOCTREE
+        method = Image.Quantize.MEDIANCUT if png.mode == "RGB" else Image.Quantize.FASTOCTREE
+        png = png.quantize(spec.quantize, method=method)
+    results = [_timed_save(png, path, profile, "PNG", spec.params, time.perf_counter() - t0)]
+
+    # 額外格式一律由未量化的原圖編碼；JPEG 不支援透明，WebP 只在有透明時保留 Alpha
+    stem = os.path.splitext(path)[0]
+    for name in extra_formats:
+        ext, fmt, params = EXTRA_FORMATS[name.strip().lower()]
+        t0 = time.perf_counter()
+        src = img.convert("RGB") if (fmt == "JPEG" or opaque) and img.mode != "RGB" else img
+        results.append(_timed_save(src, stem + ext, name.strip().lower(), fmt, params, time.perf_counter() - t0))
+    return results
@@ -0,0 +1,77 @@
+"""
+以多個行程平行繪製 matplotlib 面量圖
+matplotlib 無法安全地以多執行緒繪圖，因此改用 process pool：
+- 每個 worker 行程透過 initializer 只載入一次縣市幾何
+- worker 將繪好的 RGBA 像素直接寫入父行程配置的共享記憶體，影像不經過 pickle 傳遞
+- 疊圖 (貼到底圖) 仍由父行程負責
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+# worker 行程內的狀態 (由 _init_worker 設定)
+_worker = {}
+
+
+def _init_worker(shp_path, name_col, size, style):
+    """worker 初始化：載入 (快取的) 縣市幾何並初始化 matplotlib，每個行程只執行一次"""
+    from seanforecast.county_map import load_county_geometry
+    from seanforecast.fonts import setup_matplotlib
+
+    setup_matplotlib()
+    _worker["gdf"] = load_county_geometry(shp_path, name_col, size, style)
+    _worker["style"] = style
+
+
+def _render_job(shm_name, colors, size):
+    """在 worker 中繪製一天的面量圖，RGBA 像素寫入名為 shm_name 的共享記憶體"""
+    import pandas as pd
+    from seanforecast.county_map import draw_choropleth
+
+    gdf = _worker["gdf"]
+    img = draw_choropleth(gdf, pd.Series(colors, index=gdf.index), size, _worker["style"])
+
+    # 共享記憶體由父行程建立與釋放 (spawn 的子行程與父行程共用 resource_tracker)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        np.ndarray((size[1], size[0], 4), np.uint8, shm.buf)[:] = np.asarray(img)
+    finally:
+        shm.close()
+
+
+def render_choropleths(shp_path, name_col, geometry_size, style, jobs, processes):
+    """
+    平行繪製多張面量圖，依 jobs 順序回傳 RGBA Image 列表
+    jobs 為 [(各縣市色碼列表, (寬, 高)), ...]，色碼順序同 load_county_geometry 的列順序
+    geometry_size 決定幾何的簡化程度 (與逐日繪製時相同)
+    """
+    processes = max(1, min(processes, len(jobs)))
+    blocks = [shared_memory.SharedMemory(create=True, size=w * h * 4) for _, (w, h) in jobs]
+    try:
+        # spawn：不複製父行程的執行緒與鎖 (多產品執行器中其他產品仍在背景下載)
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(shp_path, name_col, geometry_size, style),
+        ) as pool:
+            futures = [
+                pool.submit(_render_job, shm.name, colors, size)
+                for shm, (colors, size) in zip(blocks, jobs)
+            ]
+            for f in futures:
+                f.result()
+
+        # 複製出共享記憶體後即可釋放
+        return [
+            Image.fromarray(np.ndarray((h, w, 4), np.uint8, shm.buf).copy(), "RGBA")
+            for shm, (_, (w, h)) in zip(blocks, jobs)
+        ]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
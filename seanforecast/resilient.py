@@ -0,0 +1,275 @@
+"""
+可靠的 HTTP GET：每主機連線數上限、帶抖動的指數退避重試、對慢回應發出對沖 (hedged) 請求
+- 對沖門檻取自該主機最近成功請求延遲的百分位數 (跨執行保存，樣本不足時不對沖)
+- 每個 URL 的結果 (嘗試次數、失敗次數、是否對沖、最後狀態與耗時) 記錄於 CACHE_DIR/fetch_stats.json
+"""
+
+import os
+import time
+import atexit
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+
+from seanforecast.cache import CACHE_DIR, _read_json, _write_json
+from seanforecast.stages import annotate
+
+# ==========================================
+# ⚙️ 設定區 (皆可用環境變數覆寫)
+# ==========================================
+# 重試次數 (不含第一次)；退避時間為 0 ~ min(上限, 基準 × 2^n) 之間的亂數 (full jitter)
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", "3"))
+FETCH_BACKOFF = float(os.environ.get("FETCH_BACKOFF", "0.5"))
+FETCH_BACKOFF_MAX = float(os.environ.get("FETCH_BACKOFF_MAX", "8"))
+
+# 同一主機同時進行的請求數上限 (含對沖請求)，由同一主機的所有產品共用
+# 這是各產品下載執行緒數之上的總上限：7 天預報的 FETCH_WORKERS (預設 7) 加上 2 天預報 (逐一下載) 共 8 個，
+# 預設 16 讓兩者同時執行時仍不受限，並留下對沖請求的空位；調低時會同時限制 FETCH_WORKERS 的實際並行數
+FETCH_HOST_LIMIT = int(os.environ.get("FETCH_HOST_LIMIT", "16"))
+
+# 對沖：請求超過最近延遲的第 N 百分位數仍未回應時，再送出一個相同請求，採用先回來的結果
+# FETCH_HEDGE_PERCENTILE=0 可停用
+HEDGE_PERCENTILE = float(os.environ.get("FETCH_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.2
+LATENCY_WINDOW = 200
+
+# 視為暫時性錯誤、值得重試的 HTTP 狀態碼
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+FETCH_STATS_FILE = os.path.join(CACHE_DIR, "fetch_stats.json")
+FETCH_STATS_MAX_URLS = 500
+
+
+# ==========================================
+# 📊 延遲與結果統計
+# ==========================================
+class FetchStats:
+    """各主機最近的成功延遲 (供對沖門檻使用) 與各 URL 的結果統計"""
+
+    def __init__(self, path=FETCH_STATS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._latencies = None
+        self._urls = None
+        self._dirty = False
+
+    def _load(self):
+        if self._latencies is None:
+            data = _read_json(self.path)
+            self._latencies = {
+                host: deque(samples, maxlen=LATENCY_WINDOW)
+                for host, samples in data.get("latencies", {}).items()
+            }
+            self._urls = data.get("urls", {})
+
+    def hedge_delay(self, host):
+        """對沖前等待的秒數 (延遲百分位數)；樣本不足或停用時回傳 None"""
+        if HEDGE_PERCENTILE <= 0:
+            return None
+        with self._lock:
+            self._load()
+            samples = sorted(self._latencies.get(host, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        idx = min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE / 100))
+        return max(HEDGE_MIN_DELAY, samples[idx])
+
+    def observe_latency(self, host, seconds):
+        with self._lock:
+            self._load()
+            self._latencies.setdefault(host, deque(maxlen=LATENCY_WINDOW)).append(round(seconds, 4))
+            self._dirty = True
+
+    def record(self, url, status, seconds, attempts, failures, hedged, hedge_won):
+        """累計單一 URL 的結果"""
+        with self._lock:
+            self._load()
+            entry = self._urls.setdefault(url, {
+                "requests": 0, "attempts": 0, "failures": 0, "hedged": 0, "hedge_wins": 0,
+            })
+            entry["requests"] += 1
+            entry["attempts"] += attempts
+            entry["failures"] += failures
+            entry["hedged"] += hedged
+            entry["hedge_wins"] += hedge_won
+            entry.update(last_status=status, last_seconds=round(seconds, 4), updated=time.time())
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            # 只保留最近更新的 URL
+            urls = sorted(self._urls.items(), key=lambda kv: kv[1]["updated"])[-FETCH_STATS_MAX_URLS:]
+            self._urls = dict(urls)
+            data = {
+                "latencies": {host: list(samples) for host, samples in self._latencies.items()},
+                "urls": self._urls,
+            }
+            try:
+                _write_json(self.path, data)
+                self._dirty = False
+            except OSError as e:
+                print(f"下載統計寫入失敗: {e}")
+
+
+fetch_stats = FetchStats()
+atexit.register(fetch_stats.save)
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+def _host_slot(host):
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(max(FETCH_HOST_LIMIT, 1))
+        return _host_slots[host]
+
+
+class _SlotLease:
+    """
+    單一請求佔用的主機名額；release() 只生效一次
+    對沖落敗的請求無法中斷 (requests 不支援)，由勝出方呼叫 release() 提前歸還其名額；
+    尚未取得名額就被放棄的請求則不再送出
+    """
+
+    def __init__(self, host):
+        self._slot = _host_slot(host)
+        self._lock = threading.Lock()
+        self._state = "waiting"
+
+    def acquire(self):
+        """取得名額；已被放棄時回傳 False"""
+        self._slot.acquire()
+        with self._lock:
+            if self._state == "released":
+                self._slot.release()
+                return False
+            self._state = "held"
+            return True
+
+    def release(self):
+        with self._lock:
+            held = self._state == "held"
+            self._state = "released"
+        if held:
+            self._slot.release()
+
+
+def _run_in_thread(fn, *args):
+    """
+    在 daemon 執行緒中執行 fn 並回傳 Future
+    (對沖落敗的請求可能要到逾時才結束；ThreadPoolExecutor 的執行緒會在直譯器結束前被等待，daemon 執行緒不會)
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True, name="hedged-fetch").start()
+    return future
+
+
+# ==========================================
+# 🌐 單次請求 / 對沖請求
+# ==========================================
+def _attempt(session, url, headers, timeout, lease=None):
+    """在主機連線數上限內送出一次請求 (含讀完內容)，回傳 Response"""
+    host = urlsplit(url).netloc
+    lease = lease or _SlotLease(host)
+    if not lease.acquire():
+        raise requests.RequestException(f"對沖請求已放棄: {url}")
+    try:
+        t0 = time.perf_counter()
+        r = session.get(url, headers=headers, verify=False, timeout=timeout)
+        r.content  # 在佔用名額期間讀完內容
+        elapsed = time.perf_counter() - t0
+    finally:
+        lease.release()
+    if r.status_code < 400:
+        fetch_stats.observe_latency(host, elapsed)
+    return r
+
+
+def _hedged_attempt(session, url, headers, timeout):
+    """送出請求；超過對沖門檻仍未回應且主機尚有空位時，再送一個相同請求。回傳 (Response, 是否對沖, 對沖是否勝出)"""
+    host = urlsplit(url).netloc
+    delay = fetch_stats.hedge_delay(host)
+    if delay is None:
+        return _attempt(session, url, headers, timeout), False, False
+
+    leases = {"primary": _SlotLease(host), "secondary": _SlotLease(host)}
+    primary = _run_in_thread(_attempt, session, url, headers, timeout, leases["primary"])
+    done, _ = wait([primary], timeout=delay)
+    slot = _host_slot(host)
+    if done or not slot.acquire(blocking=False):
+        return primary.result(), False, False
+    slot.release()
+
+    secondary = _run_in_thread(_attempt, session, url, headers, timeout, leases["secondary"])
+    pending, error, fallback = {primary, secondary}, None, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            try:
+                r = f.result()
+            except requests.RequestException as e:
+                error = e
+                continue
+            if r.status_code in RETRY_STATUS:
+                fallback = r
+                continue
+            # 較慢的另一個請求無法中斷 (requests 不支援)：立即歸還其主機名額，完成後自然丟棄
+            leases["secondary" if f is primary else "primary"].release()
+            return r, True, f is secondary
+    if fallback is not None:
+        return fallback, True, False
+    raise error
+
+
+def resilient_get(session, url, headers=None, timeout=15, retries=None, hedge=False):
+    """
+    GET url 並回傳 Response (狀態碼由呼叫端檢查)
+    連線錯誤、逾時與 RETRY_STATUS 狀態碼會以帶抖動的指數退避重試；hedge=True 時對慢回應發出對沖請求
+    重試用盡時：最後有回應則回傳該回應，否則拋出最後的例外
+    """
+    retries = FETCH_RETRIES if retries is None else retries
+    headers = headers or {}
+    t0 = time.perf_counter()
+    attempts = failures = hedged = hedge_won = 0
+    response, error = None, None
+
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(random.uniform(0, min(FETCH_BACKOFF_MAX, FETCH_BACKOFF * 2 ** (attempt - 1))))
+        attempts += 1
+        try:
+            if hedge:
+                response, was_hedged, won = _hedged_attempt(session, url, headers, timeout)
+                hedged += was_hedged
+                hedge_won += won
+            else:
+                response = _attempt(session, url, headers, timeout)
+            error = None
+        except requests.RequestException as e:
+            response, error = None, e
+            failures += 1
+            continue
+        if response.status_code not in RETRY_STATUS:
+            break
+        failures += 1
+
+    status = response.status_code if response is not None else type(error).__name__
+    fetch_stats.record(url, status, time.perf_counter() - t0, attempts, failures, hedged, hedge_won)
+    annotate(attempts=attempts, hedged=hedged, hedge_won=hedge_won)
+    if response is None:
+        raise error
+    return response
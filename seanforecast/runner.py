@@ -0,0 +1,165 @@
+"""
+多產品執行器：在同一個行程中執行 7 天、2 天與 AQI 預報
+各產品共用 HTTP 連線池、初始時間查詢與影像快取，互不相依的產品同時執行
+
+    python -m seanforecast run --products 7day,2day,aqi
+
+追蹤與分析：
+    --trace spans.jsonl   每個處理階段輸出一行 JSON (耗時、傳輸位元組…)，--trace-memory 另記錄 span 期間的行程記憶體峰值 (含同時執行的產品)
+    --profile 目錄         以 cProfile 分析各產品，輸出 <產品>.prof 與 <產品>.txt (產品改為依序執行)
+"""
+
+import os
+import sys
+import io
+import time
+import pstats
+import cProfile
+import argparse
+import traceback
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from seanforecast import stages
+from seanforecast.cache import InitTimeResolver
+from seanforecast.fetch import create_session, get_init_time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 產品名稱 → (腳本檔名, 是否需在主執行緒執行)
+# matplotlib 的 pyplot 非執行緒安全，AQI 固定在主執行緒執行
+PRODUCTS = {
+    "7day": ("7daysforecast.py", False),
+    "2day": ("2daysdorecast.py", False),
+    "aqi": ("AQI_forecast.py", True),
+}
+
+
+def load_product(name):
+    """以檔案路徑載入產品腳本 (檔名以數字開頭，無法直接 import)"""
+    script, _ = PRODUCTS[name]
+    path = os.path.join(REPO_DIR, script)
+    spec = importlib.util.spec_from_file_location(f"seanforecast_product_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class SharedContext:
+    """各產品共用的資源"""
+
+    def __init__(self, pool_size=16, force=False):
+        self.force = force
+        self.session = create_session(pool_size)
+        self.resolve_init_time = InitTimeResolver(partial(get_init_time, session=self.session))
+
+    def product_kwargs(self, name):
+        """依產品 main() 的參數傳入共用資源"""
+        if name == "aqi":
+            return {"session": self.session, "force": self.force}
+        return {"session": self.session, "resolve_init_time": self.resolve_init_time, "force": self.force}
+
+    def close(self):
+        self.session.close()
+
+
+def dump_profile(profiler, name, profile_dir, top=15):
+    """輸出 cProfile 結果：<產品>.prof (可用 snakeviz 等工具開啟) 與依累計時間排序的 <產品>.txt"""
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(top)
+    with open(os.path.join(profile_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+        f.write(text.getvalue())
+    print(f"[{name}] cProfile 結果已輸出至 {profile_dir}/{name}.prof")
+
+
+def run_product(name, module, context, profile_dir=None):
+    """執行單一產品，回傳 (是否成功, 秒數)；profile_dir 指定時以 cProfile 分析 (只含產品的主執行緒)"""
+    t0 = time.perf_counter()
+    try:
+        with stages.stage("product", product=name):
+            if profile_dir:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.runcall(module.main, **context.product_kwargs(name))
+                finally:
+                    dump_profile(profiler, name, profile_dir)
+            else:
+                module.main(**context.product_kwargs(name))
+        ok = True
+    except Exception:
+        print(f"✗ [{name}] 執行失敗:")
+        traceback.print_exc()
+        ok = False
+    elapsed = time.perf_counter() - t0
+    print(f"{'✓' if ok else '✗'} [{name}] 結束 ({elapsed:.1f} 秒)")
+    return ok, elapsed
+
+
+def run(products, workers=None, force=False, profile_dir=None):
+    """
+    執行多個產品，回傳 {產品: 是否成功}；force=True 時忽略 outputs/manifest.json 一律重新產生
+    profile_dir 指定時逐一執行產品 (同時只能有一個 cProfile 在執行)
+    """
+    # 先在主執行緒載入所有腳本 (import numpy / PIL / geopandas 等只做一次)
+    modules = {name: load_product(name) for name in products}
+    context = SharedContext(force=force)
+    results = {}
+    t0 = time.perf_counter()
+    try:
+        background = [n for n in products if not PRODUCTS[n][1]]
+        foreground = [n for n in products if PRODUCTS[n][1]]
+        if profile_dir:
+            background, foreground = [], list(products)
+        with ThreadPoolExecutor(max_workers=workers or max(len(background), 1)) as pool:
+            futures = {n: pool.submit(run_product, n, modules[n], context) for n in background}
+            for n in foreground:
+                results[n] = run_product(n, modules[n], context, profile_dir)
+            for n, f in futures.items():
+                results[n] = f.result()
+    finally:
+        context.close()
+
+    print(f"\n全部產品結束，共 {time.perf_counter() - t0:.1f} 秒")
+    for n in products:
+        ok, elapsed = results[n]
+        print(f"  {n:<6}{'成功' if ok else '失敗'}  {elapsed:.1f} 秒")
+    return {n: results[n][0] for n in products}
+
+
+def parse_products(value):
+    names = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = [n for n in names if n not in PRODUCTS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知的產品: {', '.join(unknown)} (可用: {', '.join(PRODUCTS)})")
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m seanforecast", description="預報圖產生工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="在同一個行程中產生多個產品")
+    p_run.add_argument(
+        "--products", type=parse_products, default=list(PRODUCTS),
+        help=f"以逗號分隔的產品清單 (預設: {','.join(PRODUCTS)})"
+    )
+    p_run.add_argument("--workers", type=int, default=None, help="同時執行的產品數 (預設: 全部同時)")
+    p_run.add_argument("--force", action="store_true", help="忽略執行紀錄，即使輸入未變動也重新產生")
+    p_run.add_argument("--trace", metavar="FILE", help="將各處理階段以 JSON lines 輸出至 FILE (\"-\" 為 stderr)")
+    p_run.add_argument("--trace-memory", action="store_true", help="span 另記錄期間整個行程的 tracemalloc 記憶體峰值 (process_mem_peak_kb，含同時執行的產品；較慢)")
+    p_run.add_argument("--profile", metavar="DIR", help="以 cProfile 分析各產品並輸出至 DIR")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        if args.trace:
+            stages.configure(args.trace, args.trace_memory)
+        results = run(args.products, args.workers, args.force, args.profile)
+        return 0 if all(results.values()) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
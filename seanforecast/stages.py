@@ -0,0 +1,188 @@
+"""
+處理階段計時與追蹤
+- 累計各階段 (初始時間查詢、下載、去白底、縮放、遮罩、合成、編碼…) 的次數與秒數 (benchmarks/bench_pipeline.py 使用)
+- 可將每個階段輸出為一行 JSON (span)：耗時、傳輸位元組、span 期間整個行程的 tracemalloc 記憶體峰值等，供監控系統收集
+預設全部關閉，關閉時每個階段只多一次判斷
+多執行緒同時執行的同一階段會分別累計 (總秒數可能大於實際經過時間)
+
+環境變數 (也可由 python -m seanforecast run --trace / --trace-memory 指定)：
+    SEANFORECAST_TRACE       → span 輸出檔路徑 (JSON lines，附加寫入；"-" 表示 stderr)
+    SEANFORECAST_TRACEMALLOC → 設為 1 時以 tracemalloc 記錄每個 span 期間的記憶體峰值 (會明顯變慢)
+                               欄位為 process_mem_peak_kb：span 期間「整個行程」的峰值減去開始時的用量，
+                               包含同時執行的其他執行緒與產品 (並非該 span 本身的配置量)；
+                               需要單一階段的數字時請只執行一個產品，並以 FETCH_WORKERS=1 逐一下載
+"""
+
+import os
+import sys
+import json
+import time
+import itertools
+import threading
+import functools
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+
+_enabled = False
+_lock = threading.Lock()
+_totals = {}
+
+# span 輸出
+_trace_file = None
+_trace_memory = False
+_span_ids = itertools.count(1)
+_current = contextvars.ContextVar("seanforecast_span", default=None)
+_memory_spans = set()
+
+
+class Span:
+    """執行中的階段；attrs 可在階段內以 annotate() 補充 (例如 bytes)"""
+
+    __slots__ = ("id", "name", "parent", "product", "attrs", "start", "mem_start", "mem_peak")
+
+    def __init__(self, name, parent, attrs):
+        self.id = next(_span_ids)
+        self.name = name
+        self.parent = parent
+        self.product = attrs.pop("product", None) or (parent.product if parent else None)
+        self.attrs = attrs
+        self.start = time.time()
+        self.mem_start = self.mem_peak = 0
+
+
+def enable(on=True):
+    """開啟 / 關閉各階段次數與秒數的累計"""
+    global _enabled
+    _enabled = on
+
+
+def configure(trace_path=None, trace_memory=False):
+    """開始輸出 span (trace_path 為 JSON lines 檔案，"-" 為 stderr)；trace_memory 時一併記錄記憶體峰值"""
+    global _trace_file, _trace_memory
+    with _lock:
+        if _trace_file not in (None, sys.stderr):
+            _trace_file.close()
+        _trace_file = None
+        if trace_path == "-":
+            _trace_file = sys.stderr
+        elif trace_path:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+            _trace_file = open(trace_path, "a", encoding="utf-8")
+        _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+def snapshot():
+    """回傳 {階段: {"count": 次數, "seconds": 總秒數}}"""
+    with _lock:
+        return {
+            name: {"count": count, "seconds": round(seconds, 4)}
+            for name, (count, seconds) in sorted(_totals.items())
+        }
+
+
+def _memory_checkpoint():
+    """(需持有 _lock) 把上次檢查以來的行程記憶體峰值計入所有進行中的 span (不分執行緒)，再重設峰值"""
+    _, peak = tracemalloc.get_traced_memory()
+    for span in _memory_spans:
+        span.mem_peak = max(span.mem_peak, peak)
+    tracemalloc.reset_peak()
+
+
+def _begin(name, attrs):
+    span = Span(name, _current.get(), attrs)
+    if _trace_memory and tracemalloc.is_tracing():
+        with _lock:
+            _memory_checkpoint()
+            span.mem_start = span.mem_peak = tracemalloc.get_traced_memory()[0]
+            _memory_spans.add(span)
+    return span
+
+
+def _end(span, seconds, error):
+    record = {
+        "ts": round(span.start, 6),
+        "name": span.name,
+        "duration_ms": round(seconds * 1000, 3),
+        "span_id": span.id,
+        "parent_id": span.parent.id if span.parent else None,
+        "product": span.product,
+        "thread": threading.current_thread().name,
+        "pid": os.getpid(),
+    }
+    record.update(span.attrs)
+    if error:
+        record["error"] = error
+    with _lock:
+        if span in _memory_spans:
+            _memory_checkpoint()
+            _memory_spans.discard(span)
+            record["process_mem_peak_kb"] = round((span.mem_peak - span.mem_start) / 1024, 1)
+        if _trace_file is not None:
+            _trace_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            _trace_file.flush()
+
+
+def _add(name, seconds):
+    with _lock:
+        count, total = _totals.get(name, (0, 0.0))
+        _totals[name] = (count + 1, total + seconds)
+
+
+@contextmanager
+def stage(name, **attrs):
+    """
+    計時一段程式碼：with stage("resize"): ...
+    attrs 會寫入 span (product= 會由子階段繼承)；未開啟任何功能時不做任何事
+    """
+    tracing = _trace_file is not None
+    if not (_enabled or tracing):
+        yield
+        return
+
+    span = _begin(name, attrs) if tracing else None
+    token = _current.set(span) if tracing else None
+    error = None
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        if _enabled:
+            _add(name, seconds)
+        if tracing:
+            _current.reset(token)
+            _end(span, seconds, error)
+
+
+def annotate(**attrs):
+    """為目前的 span 補充屬性 (例如 bytes=...)；未輸出 span 時不做任何事"""
+    span = _current.get()
+    if span is not None:
+        span.attrs.update(attrs)
+
+
+def timed(name):
+    """計時整個函式的裝飾器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# 以環境變數開啟 span 輸出 (單獨執行腳本時)
+if os.environ.get("SEANFORECAST_TRACE"):
+    configure(os.environ["SEANFORECAST_TRACE"], os.environ.get("SEANFORECAST_TRACEMALLOC") == "1")
@@ -0,0 +1,26 @@
+"""
+簡易的本地欄式儲存 (每個欄位一個 NumPy 陣列，存成 .npz)
+不需額外套件，讀取時只載入需要的欄位
+"""
+
+import os
+
+import numpy as np
+
+
+def load_frame(path, columns):
+    """讀取儲存檔為 DataFrame (只含 columns，全部為字串欄位)；檔案不存在時回傳空表"""
+    import pandas as pd
+    try:
+        with np.load(path) as data:
+            return pd.DataFrame({c: data[c].astype(object) for c in columns})
+    except (OSError, KeyError, ValueError):
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in columns})
+
+
+def save_frame(path, df, columns):
+    """以固定寬度的 Unicode 陣列逐欄寫入 (先寫暫存檔再取代)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp_path, **{c: df[c].fillna("").astype(str).to_numpy(dtype=str) for c in columns})
+    os.replace(tmp_path, path)